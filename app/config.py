@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 class Settings(BaseSettings):
     """
@@ -24,6 +25,42 @@ class Settings(BaseSettings):
         env_file_encoding = 'utf-8'
         extra = "ignore"
 
+class DatabaseSettings(BaseSettings):
+    """
+    Veritabanı bağlantı havuzu ayarları.
+
+    Settings'ten ayrı tutulur: app.database migration/CLI script'lerinden de
+    import edilir ve bu script'ler SECRET_KEY gerektirmemelidir.
+    """
+    DATABASE_URL: str
+    # Boş bırakılırsa okuma engine'i de primary'ye bağlanır
+    DATABASE_READ_URL: Optional[str] = None
+
+    # Bağlantı havuzu (worker başına). Toplam bağlantı = worker sayısı x
+    # (POOL_SIZE + MAX_OVERFLOW); PostgreSQL max_connections'a göre ayarlayın.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 10  # saniye - havuz boşalana kadar bekleme
+    DB_POOL_RECYCLE: int = 1800  # saniye - bayat bağlantıları yenile
+
+    # Okuma replikası havuzu (sadece DATABASE_READ_URL verilirse oluşturulur)
+    DB_READ_POOL_SIZE: int = 5
+    DB_READ_MAX_OVERFLOW: int = 10
+
+    # PostgreSQL statement_timeout (milisaniye, 0 = sınırsız)
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    DB_READ_STATEMENT_TIMEOUT_MS: int = 10000
+
+    class Config:
+        env_file = ".env"
+        env_file_encoding = 'utf-8'
+        extra = "ignore"
+
+@lru_cache()
+def get_database_settings():
+    """Veritabanı ayarlarını bir kez yükler ve cache'ler."""
+    return DatabaseSettings()
+
 @lru_cache()
 def get_settings():
     """
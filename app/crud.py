@@ -2,12 +2,16 @@
 CRUD (Repository) Layer - Sadece veritabanı işlemleri yapar.
 İş mantığı servis katmanına taşınmıştır.
 """
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.orm import Session, Bundle
+from sqlalchemy import text, func, tuple_
 from . import models, schemas
+from .database import primary_oturumu
+from .redis_client import cache_get, cache_set, cache_delete, cache_get_or_compute, cache_set_many_fresh
 import uuid
-import random
-from datetime import datetime
+import base64
+import struct
+import threading
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 from fastapi import HTTPException
 
@@ -33,8 +37,33 @@ def get_user_by_uye_no(db: Session, uye_no: str):
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Kullanici).offset(skip).limit(limit).all()
 
-def create_user(db: Session, user: schemas.KullaniciKayit):
-    """Sadece kullanıcı oluşturur, iş mantığı içermez."""
+def get_registration_conflicts(db: Session, email: str, telefon: str = None, tc_no: str = None, sponsor_id: int = None):
+    """
+    Kayıt öncesi benzersizlik ve sponsor kontrollerini tek sorguda yapar.
+
+    Returns:
+        Row(email_var, telefon_var, tc_var, sponsor_var)
+    """
+    return db.execute(text("""
+        SELECT
+            EXISTS (SELECT 1 FROM kullanicilar WHERE email = :email) AS email_var,
+            (CAST(:telefon AS varchar) IS NOT NULL
+                AND EXISTS (SELECT 1 FROM kullanicilar WHERE telefon = :telefon)) AS telefon_var,
+            (CAST(:tc_no AS varchar) IS NOT NULL
+                AND EXISTS (SELECT 1 FROM kullanicilar WHERE tc_no = :tc_no)) AS tc_var,
+            EXISTS (SELECT 1 FROM kullanicilar WHERE id = :sponsor_id) AS sponsor_var
+    """), {
+        "email": email,
+        "telefon": telefon or None,
+        "tc_no": tc_no or None,
+        "sponsor_id": sponsor_id
+    }).one()
+
+def create_user(db: Session, user: schemas.KullaniciKayit, commit: bool = True):
+    """
+    Sadece kullanıcı oluşturur, iş mantığı içermez.
+    commit=False ise sadece flush eder (id atanır); commit çağıran tarafa aittir.
+    """
     yeni_uye = models.Kullanici(
         tam_ad=user.tam_ad,
         email=user.email,
@@ -58,6 +87,9 @@ def create_user(db: Session, user: schemas.KullaniciKayit):
         vergi_no=user.vergi_no
     )
     db.add(yeni_uye)
+    if not commit:
+        db.flush()
+        return yeni_uye
     db.commit()
     db.refresh(yeni_uye)
     return yeni_uye
@@ -79,15 +111,40 @@ def delete_user(db: Session, user_id: int):
         return True
     return False
 
+# Üye numarası karıştırma turları: (çarpan, ekleme). Çarpanlar 10 ile aralarında
+# asal olduğundan her tur 10^UYE_NO_HANE uzayında birebir (bijektif) bir permütasyondur.
+_UYE_NO_TURLARI = ((34819637, 52710093), (89273113, 16042871))
+_uye_no_kilidi = threading.Lock()
+_uye_no_blogu = [0, 0]  # [sıradaki, bitiş) - bu worker'a ayrılmış sıra aralığı
+
+def _uye_no_karistir(sira: int) -> int:
+    """Sıra numarasını ardışık görünmeyen, çakışmasız bir numaraya eşler."""
+    uzay = 10 ** models.UYE_NO_HANE
+    for carpan, ekleme in _UYE_NO_TURLARI:
+        sira = (sira * carpan + ekleme) % uzay
+        # Hane sırasını ters çevir (yine birebir); ardışık sıralar farklı bölgelere dağılır
+        sira = int(str(sira).zfill(models.UYE_NO_HANE)[::-1])
+    return sira
+
 def generate_unique_member_number(db: Session):
-    """Benzersiz üye numarası oluşturur."""
-    while True:
-        suffix = ''.join([str(random.randint(0, 9)) for _ in range(7)])
-        aday_no = "90" + suffix
-        
-        mevcut = db.query(models.Kullanici).filter(models.Kullanici.uye_no == aday_no).first()
-        if not mevcut:
-            return aday_no
+    """
+    Benzersiz üye numarası oluşturur.
+
+    uye_no_seq sırasından blok halinde ayrılan sıra numarası karıştırılarak
+    kullanılır; aday numara için varlık sorgusu yapılmaz. Sıra sadece blok
+    bittiğinde (UYE_NO_BLOK kayıtta bir) okunur. Üretilen numaralar eski
+    rastgele (90 + 7 hane) numaralardan ayrık bir uzaydadır (90 + 8 hane).
+    """
+    with _uye_no_kilidi:
+        if _uye_no_blogu[0] >= _uye_no_blogu[1]:
+            baslangic = db.execute(text("SELECT nextval('uye_no_seq')")).scalar()
+            _uye_no_blogu[0] = baslangic
+            _uye_no_blogu[1] = baslangic + models.UYE_NO_BLOK
+
+        sira = _uye_no_blogu[0]
+        _uye_no_blogu[0] += 1
+
+    return "90" + str(_uye_no_karistir(sira)).zfill(models.UYE_NO_HANE)
 
 # ---- Kategori İşlemleri ----
 def create_category(db: Session, kategori: schemas.KategoriOlustur):
@@ -155,6 +212,55 @@ def delete_product(db: Session, urun_id: int):
     return False
 
 # ---- Sepet İşlemleri ----
+# Sepet özeti (adet, tutar, PV, CV) tek Redis anahtarında tutulur; header rozeti
+# adedi buradan okur. add/remove/clear siler; sadece get_cart_summary ıskalamada
+# doldurur (sepet sayfası yazmaz: eşzamanlı bir silmeden sonra bayat özet yazabilirdi).
+# Ürün fiyatı değişirse özet en geç TTL sonunda düzelir (sipariş her zaman
+# güncel satırlardan hesaplanır).
+CART_OZET_CACHE_TTL = 600  # saniye
+
+def _cart_summary_cache_key(kullanici_id: int) -> str:
+    return f"cart_ozet:{kullanici_id}"
+
+def _cart_summary(toplam_adet, toplam_fiyat, toplam_pv, toplam_cv) -> dict:
+    """Önbelleğe yazılabilir (JSON uyumlu) sepet özeti."""
+    return {
+        "toplam_adet": int(toplam_adet or 0),
+        "toplam_fiyat": float(toplam_fiyat or 0),
+        "toplam_pv": int(toplam_pv or 0),
+        "toplam_cv": float(toplam_cv or 0)
+    }
+
+def get_cart_summary(db: Session, kullanici_id: int) -> dict:
+    """
+    Sepet özetini döndürür: toplam_adet, toplam_fiyat, toplam_pv, toplam_cv.
+    Redis'te cache'lenir; yoksa tek aggregate sorgusuyla hesaplanır.
+    """
+    cache_key = _cart_summary_cache_key(kullanici_id)
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    fiyat = func.coalesce(func.nullif(models.Urun.indirimli_fiyat, 0), models.Urun.fiyat)
+    satir = db.query(
+        func.sum(models.SepetUrun.adet),
+        func.sum(models.SepetUrun.adet * fiyat),
+        func.sum(models.SepetUrun.adet * func.coalesce(models.Urun.pv_degeri, 0)),
+        func.sum(models.SepetUrun.adet * func.coalesce(models.Urun.cv_degeri, 0))
+    ).join(
+        models.Sepet, models.Sepet.id == models.SepetUrun.sepet_id
+    ).join(
+        models.Urun, models.Urun.id == models.SepetUrun.urun_id
+    ).filter(models.Sepet.kullanici_id == kullanici_id).one()
+
+    ozet = _cart_summary(*satir)
+    cache_set(cache_key, ozet, expire=CART_OZET_CACHE_TTL)
+    return ozet
+
+def get_cart_item_count(db: Session, kullanici_id: int) -> int:
+    """Sepetteki toplam ürün adedini döndürür (header rozeti için, sepet özetinden)."""
+    return get_cart_summary(db, kullanici_id)["toplam_adet"]
+
 def get_or_create_cart(db: Session, kullanici_id: int):
     sepet = db.query(models.Sepet).filter(models.Sepet.kullanici_id == kullanici_id).first()
     if not sepet:
@@ -179,35 +285,60 @@ def add_to_cart(db: Session, kullanici_id: int, urun_id: int, adet: int = 1):
         db.add(yeni_sepet_urun)
     
     db.commit()
+    cache_delete(_cart_summary_cache_key(kullanici_id))
     return sepet
 
 def get_cart_details(db: Session, kullanici_id: int):
+    """
+    Sepet satırlarını, ürünün sadece gösterim / fiyat / PV / CV kolonlarıyla
+    tek JOIN sorgusunda getirir (satır başına ürün sorgusu yok).
+    """
     sepet = get_or_create_cart(db, kullanici_id)
     
-    sepet_urunler = db.query(models.SepetUrun).filter(models.SepetUrun.sepet_id == sepet.id).all()
+    sepet_urunler = db.query(
+        models.SepetUrun.id,
+        models.SepetUrun.adet,
+        Bundle(
+            "urun",
+            models.Urun.id,
+            models.Urun.ad,
+            models.Urun.resim_url,
+            models.Urun.fiyat,
+            models.Urun.indirimli_fiyat,
+            models.Urun.pv_degeri,
+            models.Urun.cv_degeri
+        )
+    ).join(
+        models.Urun, models.Urun.id == models.SepetUrun.urun_id
+    ).filter(models.SepetUrun.sepet_id == sepet.id).order_by(models.SepetUrun.id).all()
     
     urunler = []
     toplam_fiyat = 0
     toplam_adet = 0
+    toplam_pv = 0
+    toplam_cv = 0
     
     for sepet_urun in sepet_urunler:
-        urun = db.query(models.Urun).filter(models.Urun.id == sepet_urun.urun_id).first()
-        if urun:
-            fiyat = urun.indirimli_fiyat if urun.indirimli_fiyat else urun.fiyat
-            urunler.append({
-                "id": sepet_urun.id,
-                "urun": urun,
-                "adet": sepet_urun.adet,
-                "toplam": fiyat * sepet_urun.adet
-            })
-            toplam_fiyat += fiyat * sepet_urun.adet
-            toplam_adet += sepet_urun.adet
+        urun = sepet_urun.urun
+        fiyat = urun.indirimli_fiyat if urun.indirimli_fiyat else urun.fiyat
+        urunler.append({
+            "id": sepet_urun.id,
+            "urun": urun,
+            "adet": sepet_urun.adet,
+            "toplam": fiyat * sepet_urun.adet
+        })
+        toplam_fiyat += fiyat * sepet_urun.adet
+        toplam_adet += sepet_urun.adet
+        toplam_pv += (urun.pv_degeri or 0) * sepet_urun.adet
+        toplam_cv += (urun.cv_degeri or 0) * sepet_urun.adet
     
     return {
         "id": sepet.id,
         "urunler": urunler,
         "toplam_fiyat": toplam_fiyat,
-        "toplam_adet": toplam_adet
+        "toplam_adet": toplam_adet,
+        "toplam_pv": toplam_pv,
+        "toplam_cv": toplam_cv
     }
 
 def remove_from_cart(db: Session, kullanici_id: int, sepet_urun_id: int):
@@ -221,6 +352,7 @@ def remove_from_cart(db: Session, kullanici_id: int, sepet_urun_id: int):
     if sepet_urun:
         db.delete(sepet_urun)
         db.commit()
+        cache_delete(_cart_summary_cache_key(kullanici_id))
     
     return True
 
@@ -228,6 +360,7 @@ def clear_cart(db: Session, kullanici_id: int):
     sepet = get_or_create_cart(db, kullanici_id)
     db.query(models.SepetUrun).filter(models.SepetUrun.sepet_id == sepet.id).delete()
     db.commit()
+    cache_delete(_cart_summary_cache_key(kullanici_id))
     return True
 
 # ---- Sipariş İşlemleri ----
@@ -253,15 +386,21 @@ def create_order_item(db: Session, siparis_urun: models.SiparisUrun):
 
 # ---- Cüzdan Hareketleri ----
 def create_wallet_transaction(db: Session, transaction: models.CuzdanHareket):
+    from app.services.earnings_service import EarningsService
+
+    if transaction.tarih is None:
+        transaction.tarih = models.get_turkey_time()
     db.add(transaction)
+    # Aylık kazanç özeti aynı transaction'da güncellenir
+    EarningsService.kaydet(db, [(transaction.user_id, transaction.islem_tipi, transaction.miktar, transaction.tarih)])
     db.commit()
     db.refresh(transaction)
     return transaction
 
-def get_user_wallet_transactions(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.CuzdanHareket).filter(
-        models.CuzdanHareket.user_id == user_id
-    ).order_by(models.CuzdanHareket.olusturma_tarihi.desc()).offset(skip).limit(limit).all()
+def get_user_wallet_transactions(db: Session, user_id: int, imlec: str = None, limit: int = 100, islem_tipi: str = None):
+    """Kullanıcının cüzdan hareketleri (yeniden eskiye, keyset). Bkz. get_wallet_statement_page."""
+    hareketler, _ = get_wallet_statement_page(db, user_id, imlec, limit, islem_tipi)
+    return hareketler
 
 # ---- İletişim Mesajları ----
 def create_contact_message(db: Session, mesaj: schemas.IletisimCreate):
@@ -329,95 +468,200 @@ def create_or_update_setting(db: Session, anahtar: str, deger: float):
     db.commit()
     return ayar
 
-# ---- Dashboard Verisi (Recursive CTE) ----
+# ---- Dashboard Verisi (Ekip Sayaçları) ----
+# Rütbe sırası (dashboard'da "sonraki rütbe" gösterimi için)
+DASHBOARD_RUTBELERI = [
+    "Distribütör", 
+    "Platinum", 
+    "Pearl", 
+    "Sapphire", 
+    "Ruby", 
+    "Emerald", 
+    "Diamond", 
+    "Double Diamond", 
+    "Triple Diamond", 
+    "President", 
+    "Double President", 
+    "Triple President"
+]
+
+DASHBOARD_CACHE_TTL = 600  # saniye - yazma kancalarının kaçırdığı değişiklikler için üst sınır
+DASHBOARD_CACHE_BAYAT_SURE = 60
+
+
+def dashboard_cache_key(user_id: int) -> str:
+    return f"dashboard_ozet:{user_id}"
+
+
+def _dashboard_ozetleri(db: Session, user_ids) -> dict:
+    """
+    Verilen kullanıcıların dashboard özetlerini toplu hesaplar (kullanıcı sayısından
+    bağımsız 3 sorgu). Değerler JSON'a uygun tiplerdedir (önbelleğe yazılabilir).
+    """
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return {}
+
+    kullanicilar = db.query(models.Kullanici).filter(models.Kullanici.id.in_(user_ids)).all()
+    if not kullanicilar:
+        return {}
+
+    # Referans ve bekleyen (ağaca yerleşmemiş) sayıları tek GROUP BY ile
+    sayimlar = db.query(
+        models.Kullanici.referans_id,
+        func.count(models.Kullanici.id),
+        func.count(models.Kullanici.id).filter(models.Kullanici.parent_id == None)
+    ).filter(
+        models.Kullanici.referans_id.in_(user_ids)
+    ).group_by(models.Kullanici.referans_id).all()
+    sayim_map = {referans_id: (toplam, bekleyen) for referans_id, toplam, bekleyen in sayimlar}
+
+    ozetler = {}
+    for kullanici in kullanicilar:
+        referanslar, bekleyenler = sayim_map.get(kullanici.id, (0, 0))
+
+        # Rütbe Mantığı
+        mevcut_rutbe = getattr(kullanici, 'rutbe', 'Distribütör')
+        try:
+            mevcut_index = DASHBOARD_RUTBELERI.index(mevcut_rutbe)
+            sonraki_rutbe = DASHBOARD_RUTBELERI[mevcut_index + 1] if mevcut_index + 1 < len(DASHBOARD_RUTBELERI) else None
+        except ValueError:
+            sonraki_rutbe = "Platinum" # Bilinmeyen rütbe ise varsayılan
+
+        ozetler[kullanici.id] = {
+            "id": kullanici.id,
+            "uye_no": kullanici.uye_no,
+            "tam_ad": kullanici.tam_ad,
+            "email": kullanici.email,
+            "rutbe": mevcut_rutbe,
+            "sonraki_rutbe": sonraki_rutbe,
+            "toplam_cv": float(kullanici.toplam_cv or 0),
+            "mevcut_sol_pv": kullanici.sol_pv,
+            "mevcut_sag_pv": kullanici.sag_pv,
+            # Kol bazında ekip sayıları - yerleşimde güncellenen sayaç kolonlarından
+            "toplam_sol_ekip": kullanici.sol_ekip_sayisi or 0,
+            "toplam_sag_ekip": kullanici.sag_ekip_sayisi or 0,
+            "referans_sayisi": referanslar,
+            "bekleyen_sayisi": bekleyenler,
+            "profil_resmi": getattr(kullanici, 'profil_resmi', None)
+        }
+    return ozetler
+
+
 def get_dashboard_data(user_id: int, db: Session):
     """
-    Dashboard verilerini getirir. Recursive CTE kullanır.
-    NOT: Bu fonksiyon iş mantığı içeriyor olabilir, ileride servis katmanına taşınabilir.
+    Dashboard verilerini getirir. Ekip sayıları kullanıcı satırındaki sayaçlardan okunur.
+
+    Özet kullanıcı başına Redis'te tutulur (stampede korumalı). Ödeme, kayıt ve
+    yerleştirme akışları commit sonrası refresh_dashboard_summaries /
+    invalidate_dashboard_summaries ile önbelleği günceller.
     """
-    kullanici = db.query(models.Kullanici).filter(models.Kullanici.id == user_id).first()
-    if not kullanici:
-        return None
-
-    # Recursive CTE sorgusu
-    cte_query = text("""
-        WITH RECURSIVE alt_uyeler (id, parent_id, kol) AS (
-            -- Başlangıç (Anchor): Ana kullanıcının doğrudan alt üyeleri
-            SELECT id, parent_id, kol
-            FROM kullanicilar
-            WHERE parent_id = :user_id
-            
-            UNION ALL
-            
-            -- Tekrarlanan (Recursive) Kısım: Bir önceki adımda bulunan üyelerin alt üyeleri
-            SELECT u.id, u.parent_id, u.kol
-            FROM kullanicilar u
-            INNER JOIN alt_uyeler au ON u.parent_id = au.id
-        )
-        -- Sonuç: Kol (SOL/SAĞ) bazında gruplayarak üye sayısını al
-        SELECT kol, COUNT(id) as uye_sayisi
-        FROM alt_uyeler
-        GROUP BY kol;
-    """)
-    
-    sol_ekip = 0
-    sag_ekip = 0
-    
-    try:
-        result = db.execute(cte_query, {"user_id": user_id}).fetchall()
-        for row in result:
-            if row[0] == 'SOL':
-                sol_ekip = row[1]
-            elif row[0] == 'SAG':
-                sag_ekip = row[1]
-    except Exception as e:
-        print(f"CTE sorgusu hatası: {e}")
-
-    referanslar = db.query(models.Kullanici).filter(models.Kullanici.referans_id == user_id).count()
-    bekleyenler = db.query(models.Kullanici).filter(
-        models.Kullanici.referans_id == user_id,
-        models.Kullanici.parent_id == None
-    ).count()
-
-    # Rütbe Mantığı
-    rutbeler = [
-        "Distribütör", 
-        "Platinum", 
-        "Pearl", 
-        "Sapphire", 
-        "Ruby", 
-        "Emerald", 
-        "Diamond", 
-        "Double Diamond", 
-        "Triple Diamond", 
-        "President", 
-        "Double President", 
-        "Triple President"
-    ]
-    mevcut_rutbe = getattr(kullanici, 'rutbe', 'Distribütör')
-    
+    def _hesapla():
+        # Paylaşılan özet replikadan hesaplanmaz: Gecikmeli bir snapshot TTL
+        # boyunca herkese sunulurdu. Replika yoksa isteğin oturumu kullanılır.
+        with primary_oturumu(db) as oturum:
+            return _dashboard_ozetleri(oturum, [user_id]).get(user_id)
+
+    return cache_get_or_compute(
+        dashboard_cache_key(user_id),
+        _hesapla,
+        expire=DASHBOARD_CACHE_TTL,
+        bayat_sure=DASHBOARD_CACHE_BAYAT_SURE
+    )
+
+
+def refresh_dashboard_summaries(db: Session, user_ids) -> None:
+    """
+    Write-through: Verilen kullanıcıların özetlerini toplu yeniden hesaplayıp
+    önbelleğe yazar. Commit'ten sonra çağrılmalıdır.
+    """
+    cache_set_many_fresh(
+        {dashboard_cache_key(user_id): ozet for user_id, ozet in _dashboard_ozetleri(db, user_ids).items()},
+        expire=DASHBOARD_CACHE_TTL,
+        bayat_sure=DASHBOARD_CACHE_BAYAT_SURE
+    )
+
+
+def invalidate_dashboard_summaries(user_ids) -> None:
+    """
+    Özetleri önbellekten siler (tek DEL). Etkilenen kullanıcı sayısı derinlikle
+    büyüyebildiğinde (örn. yerleştirmede tüm atalar) write-through yerine kullanılır.
+    """
+    keys = {dashboard_cache_key(user_id) for user_id in user_ids}
+    if keys:
+        cache_delete(*keys)
+
+
+# ---- Cüzdan Ekstresi (Keyset Sayfalama) ----
+EKSTRE_SAYFA_BOYUTU = 20
+
+
+_EKSTRE_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EKSTRE_IMLEC_FORMATI = struct.Struct(">qq")  # (epoch mikrosaniye, hareket id)
+
+
+def _ekstre_imleci(hareket: models.CuzdanHareket) -> str:
+    """
+    Opak, URL-güvenli imleç: (tarih, id) ikilisi urlsafe base64 olarak.
+    ISO tarih içindeki '+' query string'de boşluğa çözüldüğü için kullanılmaz.
+    """
+    mikrosaniye = (hareket.tarih - _EKSTRE_EPOCH) // timedelta(microseconds=1)
+    ham = _EKSTRE_IMLEC_FORMATI.pack(mikrosaniye, hareket.id)
+    return base64.urlsafe_b64encode(ham).rstrip(b"=").decode("ascii")
+
+
+def _ekstre_imlecini_coz(imlec: str):
+    """İmleci (tarih, id) ikilisine çözer; bozuk imleçte ValueError."""
     try:
-        mevcut_index = rutbeler.index(mevcut_rutbe)
-        sonraki_rutbe = rutbeler[mevcut_index + 1] if mevcut_index + 1 < len(rutbeler) else None
-    except ValueError:
-        sonraki_rutbe = "Platinum" # Bilinmeyen rütbe ise varsayılan
+        ham = base64.urlsafe_b64decode(imlec + "=" * (-len(imlec) % 4))
+        mikrosaniye, hareket_id = _EKSTRE_IMLEC_FORMATI.unpack(ham)
+        # Biçimce geçerli ama aralık dışı imleç (çok büyük/küçük mikrosaniye) OverflowError verir
+        tarih = _EKSTRE_EPOCH + timedelta(microseconds=mikrosaniye)
+    except (ValueError, OverflowError, struct.error) as e:
+        raise ValueError(f"Geçersiz imleç: {imlec}") from e
+    return tarih, hareket_id
+
+
+def get_wallet_statement_page(
+    db: Session,
+    user_id: int,
+    imlec: str = None,
+    limit: int = EKSTRE_SAYFA_BOYUTU,
+    islem_tipi: str = None
+):
+    """
+    Cüzdan ekstresinin bir sayfasını (yeniden eskiye) getirir.
 
-    return {
-        "id": kullanici.id,
-        "uye_no": kullanici.uye_no,
-        "tam_ad": kullanici.tam_ad,
-        "email": kullanici.email,
-        "rutbe": mevcut_rutbe,
-        "sonraki_rutbe": sonraki_rutbe,
-        "toplam_cv": kullanici.toplam_cv,
-        "mevcut_sol_pv": kullanici.sol_pv,
-        "mevcut_sag_pv": kullanici.sag_pv,
-        "toplam_sol_ekip": sol_ekip,
-        "toplam_sag_ekip": sag_ekip,
-        "referans_sayisi": referanslar,
-        "bekleyen_sayisi": bekleyenler,
-        "profil_resmi": getattr(kullanici, 'profil_resmi', None)
-    }
+    OFFSET yerine (tarih, id) imleci kullanılır: Her sayfa, geçmiş ne kadar
+    uzun olursa olsun indeks üzerinde sadece `limit` satır okur.
+    - Tüm hareketler: ix_cuzdan_user_tarih_id
+    - islem_tipi verilirse (bonus sayfaları): ix_cuzdan_user_tip_tarih
+
+    Returns:
+        (hareketler, sonraki_imlec) - son sayfada sonraki_imlec None
+    """
+    sorgu = db.query(models.CuzdanHareket).filter(models.CuzdanHareket.user_id == user_id)
+
+    if islem_tipi:
+        sorgu = sorgu.filter(models.CuzdanHareket.islem_tipi == islem_tipi)
+
+    if imlec:
+        tarih, hareket_id = _ekstre_imlecini_coz(imlec)
+        sorgu = sorgu.filter(
+            tuple_(models.CuzdanHareket.tarih, models.CuzdanHareket.id) < (tarih, hareket_id)
+        )
+
+    hareketler = sorgu.order_by(
+        models.CuzdanHareket.tarih.desc(),
+        models.CuzdanHareket.id.desc()
+    ).limit(limit + 1).all()
+
+    sonraki_imlec = None
+    if len(hareketler) > limit:
+        hareketler = hareketler[:limit]
+        sonraki_imlec = _ekstre_imleci(hareketler[-1])
+
+    return hareketler, sonraki_imlec
 
 # ---- Yardımcı Fonksiyonlar ----
 def get_direct_downlines(db: Session, user_id: int):
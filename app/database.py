@@ -1,20 +1,103 @@
-import os
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
+from app.config import get_database_settings
+
 # .env dosyasındaki değişkenleri yükle
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+db_settings = get_database_settings()
+
+DATABASE_URL = db_settings.DATABASE_URL
+DATABASE_READ_URL = db_settings.DATABASE_READ_URL
+
+
+def _engine_olustur(url: str, pool_size: int, max_overflow: int, statement_timeout_ms: int, salt_okunur: bool = False):
+    """
+    Ayarlı bağlantı havuzuyla engine oluşturur.
+
+    - pool_pre_ping: Kopmuş bağlantılar (DB restart, failover) istek sırasında değil havuzdan alınırken elenir
+    - pool_recycle: Uzun yaşayan bağlantılar periyodik olarak yenilenir
+    - statement_timeout: Yavaş bir sorgu bağlantıyı (ve havuzu) süresiz tutamaz
+    """
+    secenekler = [f"-c statement_timeout={statement_timeout_ms}"]
+    if salt_okunur:
+        # Replika yoksa da okuma oturumu yanlışlıkla yazamasın
+        secenekler.append("-c default_transaction_read_only=on")
+
+    return create_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=db_settings.DB_POOL_TIMEOUT,
+        pool_recycle=db_settings.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args={"options": " ".join(secenekler)},
+    )
+
 
-# Engine, veritabanı ile olan fiziksel bağlantıdır
-engine = create_engine(DATABASE_URL)
+# Engine, veritabanı ile olan fiziksel bağlantıdır (yazma + tutarlı okuma)
+engine = _engine_olustur(
+    DATABASE_URL,
+    db_settings.DB_POOL_SIZE,
+    db_settings.DB_MAX_OVERFLOW,
+    db_settings.DB_STATEMENT_TIMEOUT_MS,
+)
+
+# Okuma engine'i: Ağaç, dashboard ve katalog gibi salt okunur sayfalar için.
+# DATABASE_READ_URL verilmezse (veya primary ile aynıysa) ikinci bir havuz açılmaz;
+# okuma oturumları primary havuzunu kullanır, salt okunurluk ve okuma
+# statement_timeout'u transaction başında ayarlanır (bkz. _okuma_transaction_ayarla).
+AYRI_OKUMA_HAVUZU = bool(DATABASE_READ_URL) and DATABASE_READ_URL != DATABASE_URL
+
+if AYRI_OKUMA_HAVUZU:
+    read_engine = _engine_olustur(
+        DATABASE_READ_URL,
+        db_settings.DB_READ_POOL_SIZE,
+        db_settings.DB_READ_MAX_OVERFLOW,
+        db_settings.DB_READ_STATEMENT_TIMEOUT_MS,
+        salt_okunur=True,
+    )
+else:
+    read_engine = engine
 
 # SessionLocal, her bir isteğe özel veritabanı oturumudur
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# ReadSessionLocal, salt okunur istekler için (replika / okuma havuzu)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+if not AYRI_OKUMA_HAVUZU:
+    @event.listens_for(ReadSessionLocal, "after_begin")
+    def _okuma_transaction_ayarla(session, transaction, connection):
+        # Paylaşılan primary bağlantısında okuma oturumu yanlışlıkla yazamasın;
+        # SET LOCAL transaction bitince bağlantı havuza varsayılanlarla döner
+        connection.exec_driver_sql("SET TRANSACTION READ ONLY")
+        connection.exec_driver_sql(
+            f"SET LOCAL statement_timeout = {int(db_settings.DB_READ_STATEMENT_TIMEOUT_MS)}"
+        )
+
+@contextmanager
+def primary_oturumu(db):
+    """
+    Paylaşılan önbelleği dolduracak okumalar için primary oturumu verir.
+
+    Ayrı replika yoksa çağıranın oturumu zaten primary'dedir ve aynen kullanılır
+    (istek başına ek bağlantı açılmaz); replika varsa kısa ömürlü bir primary
+    oturumu açılıp kapatılır.
+    """
+    if not AYRI_OKUMA_HAVUZU:
+        yield db
+        return
+    with SessionLocal() as primary_db:
+        yield primary_db
+
+
 # Base, modellerimizin miras alacağı ana sınıftır
 Base = declarative_base()
 
@@ -24,4 +107,4 @@ def baglantiyi_test_et():
         with engine.connect() as connection:
             print("PostgreSQL Bağlantısı Başarılı! ✅")
     except Exception as e:
-        print(f"Hata: Bağlantı kurulamadı! ❌ \nDetay: {e}")
\ No newline at end of file
+        print(f"Hata: Bağlantı kurulamadı! ❌ \nDetay: {e}")
@@ -1,6 +1,7 @@
-from .database import SessionLocal
+from .database import SessionLocal, ReadSessionLocal
 from fastapi.templating import Jinja2Templates
 from fastapi import Request, HTTPException, status
+from starlette.concurrency import run_in_threadpool
 
 templates = Jinja2Templates(directory="templates")
 
@@ -30,6 +31,28 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    """
+    Salt okunur istekler (ağaç, dashboard, katalog) için okuma oturumu.
+    DATABASE_READ_URL tanımlıysa replikaya gider; yazma yapılamaz.
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def run_db(func, *args, **kwargs):
+    """
+    Senkron veritabanı işini (SQLAlchemy Session, tembel request.state alanları)
+    threadpool'da çalıştırır; async handler'larda event loop'u bloklamaz.
+
+    Sadece gerçekten await eden (request.form(), file.read() vb.) async
+    handler'lar için; diğer handler'lar düz `def` olmalı (FastAPI zaten
+    threadpool'da çalıştırır).
+    """
+    return await run_in_threadpool(func, *args, **kwargs)
+
 def get_current_admin_user(request: Request):
     """Admin authentication dependency for protected routes."""
     token = request.cookies.get("admin_token")
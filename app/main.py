@@ -13,7 +13,8 @@ from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from . import models
-from .database import SessionLocal, engine
+from .database import engine
+from .dependencies import run_db
 from .routers import auth, mlm, shop, general, admin, admin_products, dashboard, home, content, ebulten, sms, banks, catalogs, roles, forms
 
 @asynccontextmanager
@@ -65,32 +66,31 @@ templates.env.filters["format_large_number"] = format_large_number
 @app.exception_handler(StarletteHTTPException)
 async def custom_http_exception_handler(request: Request, exc: StarletteHTTPException):
     if exc.status_code == 404:
-        return templates.TemplateResponse("404.html", {"request": request}, status_code=404)
+        # base.html request.state.user/site_ayarlar'a erişir (tembel DB yüklemesi)
+        return await run_db(templates.TemplateResponse, "404.html", {"request": request}, status_code=404)
     return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
 
 from jose import JWTError
 from app import utils, models, redis_client
-from app.database import SessionLocal
+from app.request_context import RequestContext
 from starlette.responses import JSONResponse
 
 @app.middleware("http")
 async def auth_middleware(request: Request, call_next):
-    request.state.user = None
-    request.state.cart_count = 0
-    request.state.site_ayarlar = None
+    """
+    Sadece token claim'lerini çözer (JWT + Redis blocklist); veritabanına dokunmaz.
+    Kullanıcı, sepet ve site ayarları RequestContext üzerinden ilk erişimde yüklenir.
+    """
+    ctx = RequestContext(request.scope.get("state"))
+    request.scope["state"] = ctx
 
     if request.url.path.startswith(("/static", "/admin", "/bestsoft")):
+        ctx.update(user=None, cart_count=0, site_ayarlar=None)
         return await call_next(request)
 
-    db = SessionLocal()
     try:
-        # Sync query
-        site_ayarlar = db.query(models.SiteAyarlari).first()
-        request.state.site_ayarlar = site_ayarlar or models.SiteAyarlari()
-
         token_str_with_bearer = request.cookies.get("access_token")
         if not token_str_with_bearer or not token_str_with_bearer.startswith("Bearer "):
-            print(f"[AUTH] No token found for {request.url.path}")
             return await call_next(request)
 
         _, _, token_str = token_str_with_bearer.partition(" ")
@@ -113,39 +113,25 @@ async def auth_middleware(request: Request, call_next):
                  print(f"[AUTH] No user_id in token for {request.url.path}")
                  return await call_next(request)
 
-            # Sync user query
-            user = db.query(models.Kullanici).filter(models.Kullanici.id == int(user_id)).first()
-            if not user:
-                # Kullanıcı veritabanından silinmiş.
-                print(f"[AUTH] User {user_id} not found in DB for {request.url.path}")
-                response = await call_next(request)
-                response.delete_cookie("access_token")
-                return response
-
-
-            request.state.user = user
-            print(f"[AUTH] User {user.id} authenticated for {request.url.path}")
-
-            # Sync sepet query
-            sepet = db.query(models.Sepet).filter(models.Sepet.kullanici_id == user.id).first()
-
-            if sepet:
-                cart_items = db.query(models.SepetUrun.adet).filter(models.SepetUrun.sepet_id == sepet.id).all()
-                request.state.cart_count = sum(item.adet for item in cart_items)
+            # Kullanıcı satırı sadece request.state.user erişildiğinde yüklenir
+            ctx.user_id = int(user_id)
 
         except Exception as e: # JWTError or other decode errors
             # Invalid token, just proceed without user
             print(f"[AUTH] Token decode error for {request.url.path}: {e}")
-            pass
 
-        return await call_next(request)
+        response = await call_next(request)
+
+        if ctx.kullanici_bulunamadi:
+            # Kullanıcı veritabanından silinmiş.
+            response.delete_cookie("access_token")
+
+        return response
 
-    except Exception as e:
-        # General middleware error
-        print(f"Middleware Error: {e}")
-        return await call_next(request)
     finally:
-        db.close()
+        if ctx.oturum_acik:
+            # Bağlantıyı havuza iade (rollback) event loop dışında yapılır
+            await run_db(ctx.close)
 
 
 # --- ADMIN GÜVENLİK DUVARI (Artık Ayrı Bir Dependency Olmalı) ---
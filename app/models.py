@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime, Text, Boolean, Numeric
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime, Text, Boolean, Numeric, Index, Sequence
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from decimal import Decimal
@@ -15,6 +15,21 @@ ORAN_SCALE = 6  # Oranlar için daha fazla hassasiyet (örn: 0.130000)
 def get_turkey_time():
     return datetime.now(ZoneInfo("Europe/Istanbul"))
 
+# Üye numarası sırası: Her nextval bir worker'a UYE_NO_BLOK'luk numara bloğu ayırır
+# (crud.generate_unique_member_number). Numara uzayı 8 hane (90 + 00000000..99999999):
+# Eski rastgele numaralar 7 haneli (90 + 7 hane) olduğundan yeni numaralar onlarla
+# hiçbir zaman çakışmaz (uzunlukları farklı).
+UYE_NO_HANE = 8
+UYE_NO_BLOK = 100
+UYE_NO_SIRASI = Sequence(
+    "uye_no_seq",
+    start=0,
+    minvalue=0,
+    maxvalue=10 ** UYE_NO_HANE - UYE_NO_BLOK,
+    increment=UYE_NO_BLOK,
+    metadata=Base.metadata
+)
+
 class KolPozisyon(str, enum.Enum):
     SAG = "SAG"
     SOL = "SOL"
@@ -61,9 +76,41 @@ class Kullanici(Base):
     toplam_sol_pv = Column(Integer, default=0)
     toplam_sag_pv = Column(Integer, default=0)
 
+    # Ekip Sayaçları (yerleşimde upline boyunca artırılır)
+    sol_ekip_sayisi = Column(Integer, default=0, nullable=False, server_default="0")
+    sag_ekip_sayisi = Column(Integer, default=0, nullable=False, server_default="0")
+
     kayit_tarihi = Column(DateTime(timezone=True), default=get_turkey_time)
     yerlestirme_tarihi = Column(DateTime(timezone=True), nullable=True)
 
+    __table_args__ = (
+        # Bir parent'ın her kolunda tek çocuk (yerleşim yarışını veritabanı engeller)
+        Index("ux_kullanicilar_parent_kol", parent_id, kol, unique=True),
+        # Sponsor sorguları ve bekleyen (yerleşmemiş) üyeler: WHERE referans_id AND parent_id IS NULL
+        Index("ix_kullanicilar_referans_parent", referans_id, parent_id),
+        # Boş bırakılan telefon / TC No benzersizlik dışında (<> '' NULL'ları da dışarıda bırakır)
+        Index("ux_kullanicilar_telefon", telefon, unique=True, postgresql_where=(telefon != "")),
+        Index("ux_kullanicilar_tc_no", tc_no, unique=True, postgresql_where=(tc_no != "")),
+    )
+
+class KullaniciAgacYolu(Base):
+    """
+    Binary ağaç için closure table (ata-torun indeksi).
+    Her satır "alt_id, ata_id'nin ağacında derinlik kadar aşağıda ve ata'nın kol tarafında" demektir.
+    Alt ağaç sayımı, kol üyeliği ve "X, Y'nin altında mı?" kontrolleri recursive CTE yerine
+    tek indeksli sorguyla yapılır. BinaryTreeService.place_user_in_tree tarafından güncellenir.
+    """
+    __tablename__ = "kullanici_agac_yollari"
+
+    ata_id = Column(Integer, ForeignKey("kullanicilar.id", ondelete="CASCADE"), primary_key=True)
+    alt_id = Column(Integer, ForeignKey("kullanicilar.id", ondelete="CASCADE"), primary_key=True, index=True)
+    derinlik = Column(Integer, nullable=False)  # 1 = doğrudan alt üye
+    kol = Column(Enum(KolPozisyon), nullable=False)  # Ata'nın hangi kolunda
+
+    __table_args__ = (
+        Index("ix_agac_yollari_ata_kol_derinlik", "ata_id", "kol", "derinlik"),
+    )
+
 class Ayarlar(Base):
     __tablename__ = "ayarlar"
 
@@ -75,11 +122,37 @@ class CuzdanHareket(Base):
     __tablename__ = "cuzdan_hareketleri"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
+    user_id = Column(Integer)  # Composite indekslerin ilk kolonu (tekil indeks gereksiz)
     miktar = Column(Numeric(PARA_PRECISION, PARA_SCALE))  # Para miktarı - hassas
     islem_tipi = Column(String) # "REFERANS", "ESLESME", "LIDERLIK"
     aciklama = Column(String)
     tarih = Column(DateTime(timezone=True), default=get_turkey_time)
+    kaynak_user_id = Column(Integer, nullable=True)  # Hareketi doğuran üye (örn. referans bonusunda yeni kayıt)
+
+    __table_args__ = (
+        # Ekstre: WHERE user_id AND (tarih, id) < imleç ORDER BY tarih DESC, id DESC
+        # (keyset sayfalama). Tüm kolonlar aynı yönde: İndeks geriye taranır, hem
+        # sıralama hem imleç sınırı indeksten karşılanır (ek sort/filtre yok).
+        Index("ix_cuzdan_user_tarih_id", user_id, tarih, id),
+        # Bonus sayfaları: WHERE user_id AND islem_tipi ORDER BY tarih
+        Index("ix_cuzdan_user_tip_tarih", user_id, islem_tipi, tarih),
+    )
+
+class AylikKazanc(Base):
+    """
+    Kullanıcı / ay / işlem tipi bazında cüzdan kazancı özeti (rollup).
+
+    Cüzdan hareketi yazılırken artımlı güncellenir (EarningsService.kaydet);
+    prim sayfaları ham hareketleri taramak yerine bu tablodan okur.
+    """
+    __tablename__ = "aylik_kazanclar"
+
+    user_id = Column(Integer, primary_key=True)
+    yil = Column(Integer, primary_key=True)
+    ay = Column(Integer, primary_key=True)
+    islem_tipi = Column(String, primary_key=True)
+    toplam = Column(Numeric(PARA_PRECISION, PARA_SCALE), nullable=False, default=0)
+    adet = Column(Integer, nullable=False, default=0)
 
 class IletisimMesaji(Base):
     __tablename__ = "iletisim_mesajlari"
@@ -1,75 +1,533 @@
 import redis
 import os
 import json
+import logging
+import threading
+import time
+import uuid
+import zlib
 from dotenv import load_dotenv
 
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
 load_dotenv()
 
 # Varsayılan olarak localhost
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
-try:
-    redis_client = redis.from_url(REDIS_URL, decode_responses=True)
-    # Ping testi
-    redis_client.ping()
-    print("Redis bağlantısı başarılı.")
-    REDIS_AVAILABLE = True
-except Exception as e:
-    print(f"Redis bağlantı hatası: {e}")
-    print("Sistem Redis olmadan veritabanı modunda çalışacak.")
-    REDIS_AVAILABLE = False
-    redis_client = None
+# Önbellek değer kodlaması: "json" (varsayılan) veya "msgpack" (kuruluysa)
+REDIS_CACHE_CODEC = os.getenv("REDIS_CACHE_CODEC", "json")
+# Bu boyutun (byte) üzerindeki değerler zlib ile sıkıştırılır
+REDIS_SIKISTIRMA_ESIGI = int(os.getenv("REDIS_SIKISTIRMA_ESIGI", "1024"))
 
-def cache_get(key: str):
-    if not REDIS_AVAILABLE or not redis_client:
-        return None
+# Bağlantı havuzu ve zaman aşımları (saniye). Redis yavaşladığında istekler
+# socket timeout'u kadar değil, en fazla bu süre kadar bekler.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.25"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5"))
+
+# Devre kesici: Art arda bu kadar hatada devre açılır, Redis çağrıları
+# atlanır ve arka planda her REDIS_YENIDEN_DENEME_ARALIGI saniyede ping atılır.
+REDIS_HATA_ESIGI = int(os.getenv("REDIS_HATA_ESIGI", "3"))
+REDIS_YENIDEN_DENEME_ARALIGI = float(os.getenv("REDIS_YENIDEN_DENEME_ARALIGI", "5"))
+
+logger = logging.getLogger(__name__)
+
+# Değerler binary (codec başlığı + payload) saklandığı için decode_responses kapalı
+_pool = redis.ConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    health_check_interval=30,
+)
+redis_client = redis.Redis(connection_pool=_pool)
+
+# Devre kapalıyken True; diğer modüller (settings_cache) okur
+REDIS_AVAILABLE = False
+
+
+# ---- Sayaçlar ----
+
+_sayac_kilidi = threading.Lock()
+_sayaclar = {"hit": 0, "miss": 0, "error": 0, "atlanan": 0}
+
+
+def _say(ad: str) -> None:
+    with _sayac_kilidi:
+        _sayaclar[ad] += 1
+
+
+def get_cache_stats() -> dict:
+    """Hit/miss/hata sayaçları ve devre durumu (izleme için)."""
+    with _sayac_kilidi:
+        istatistik = dict(_sayaclar)
+    istatistik["redis_available"] = REDIS_AVAILABLE
+    return istatistik
+
+
+# ---- Devre Kesici (Circuit Breaker) ----
+
+class DevreKesici:
+    """
+    Art arda REDIS_HATA_ESIGI hatada devreyi açar. Açıkken Redis çağrıları
+    hiç denenmez (istekler timeout beklemez); arka plan thread'i Redis'e ping
+    atar ve cevap gelince devreyi kapatır.
+    """
+
+    def __init__(self):
+        self._kilit = threading.Lock()
+        self._ardisik_hata = 0
+        self._kurtarma_calisiyor = False
+
+    def basari(self) -> None:
+        self._ardisik_hata = 0
+
+    def hata(self, hata: Exception) -> None:
+        _say("error")
+        with self._kilit:
+            self._ardisik_hata += 1
+            if self._ardisik_hata >= REDIS_HATA_ESIGI and REDIS_AVAILABLE:
+                logger.warning(f"Redis devre kesici açıldı ({self._ardisik_hata} ardışık hata): {hata}")
+                self._ac()
+
+    def _ac(self) -> None:
+        global REDIS_AVAILABLE
+        REDIS_AVAILABLE = False
+        if not self._kurtarma_calisiyor:
+            self._kurtarma_calisiyor = True
+            threading.Thread(target=self._kurtarma_dongusu, name="redis-devre-kesici", daemon=True).start()
+
+    def _kurtarma_dongusu(self) -> None:
+        global REDIS_AVAILABLE
+        while True:
+            try:
+                redis_client.ping()
+            except redis.RedisError:
+                time.sleep(REDIS_YENIDEN_DENEME_ARALIGI)
+                continue
+
+            with self._kilit:
+                self._ardisik_hata = 0
+                self._kurtarma_calisiyor = False
+                REDIS_AVAILABLE = True
+            logger.info("Redis bağlantısı yeniden kuruldu, devre kesici kapandı.")
+            return
+
+    def baslat(self) -> None:
+        """İlk bağlantı denemesi; başarısızsa devre açık başlar ve arka planda denenir."""
+        global REDIS_AVAILABLE
+        try:
+            redis_client.ping()
+            REDIS_AVAILABLE = True
+            print("Redis bağlantısı başarılı.")
+        except redis.RedisError as e:
+            print(f"Redis bağlantı hatası: {e}")
+            print("Sistem Redis gelene kadar veritabanı modunda çalışacak.")
+            with self._kilit:
+                self._ac()
+
+
+_devre = DevreKesici()
+_devre.baslat()
+
+
+# Redis'e hiç ulaşılamadığını (miss'ten ayırmak için) belirten işaret
+_ERISILEMEDI = object()
+
+
+def _calistir(islem, varsayilan=None):
+    """
+    Redis komutunu devre kesici üzerinden çalıştırır.
+    Devre açıksa veya komut hata verirse varsayilan döner (istek asla patlamaz).
+    """
+    if not REDIS_AVAILABLE:
+        _say("atlanan")
+        return varsayilan
     try:
-        data = redis_client.get(key)
-        if data:
-            return json.loads(data)
-    except:
+        sonuc = islem(redis_client)
+    except redis.RedisError as e:
+        _devre.hata(e)
+        return varsayilan
+    _devre.basari()
+    return sonuc
+
+
+# ---- Değer Kodlama (Codec) ----
+#
+# Saklanan her değer 3 byte'lık başlıkla başlar:
+#   [format versiyonu][codec id][sıkıştırma]  + payload
+#
+# Bilinmeyen versiyon/codec ile yazılmış değerler miss sayılır; eski (başlıksız
+# düz JSON) değerler de okunabilir. Böylece codec değişikliğinde önbellek
+# temizlenmeden geçiş yapılır.
+
+FORMAT_VERSIYONU = 1
+SIKISTIRMA_YOK = b"-"
+SIKISTIRMA_ZLIB = b"z"
+
+
+class JsonCodec:
+    """Kompakt JSON (UTF-8 bytes)"""
+    kod = b"j"
+
+    @staticmethod
+    def encode(value) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def decode(data: bytes):
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    """MessagePack (msgpack kuruluysa)"""
+    kod = b"m"
+
+    @staticmethod
+    def encode(value) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    @staticmethod
+    def decode(data: bytes):
+        return msgpack.unpackb(data, raw=False)
+
+
+_CODECLER = {JsonCodec.kod: JsonCodec}
+if MSGPACK_AVAILABLE:
+    _CODECLER[MsgpackCodec.kod] = MsgpackCodec
+
+if REDIS_CACHE_CODEC == "msgpack" and MSGPACK_AVAILABLE:
+    VARSAYILAN_CODEC = MsgpackCodec
+else:
+    VARSAYILAN_CODEC = JsonCodec
+
+
+def _paketle(codec, payload: bytes) -> bytes:
+    if len(payload) > REDIS_SIKISTIRMA_ESIGI:
+        return bytes([FORMAT_VERSIYONU]) + codec.kod + SIKISTIRMA_ZLIB + zlib.compress(payload)
+    return bytes([FORMAT_VERSIYONU]) + codec.kod + SIKISTIRMA_YOK + payload
+
+
+def _ac(data: bytes):
+    """(codec, payload) döndürür; çözülemeyen değer için (None, None)."""
+    if data[:1] != bytes([FORMAT_VERSIYONU]):
+        # Başlıksız eski değer (düz JSON metni)
+        if data[:1] in (b"{", b"[", b'"') or data[:1].isdigit():
+            return JsonCodec, data
+        return None, None
+
+    codec = _CODECLER.get(data[1:2])
+    if codec is None:
+        return None, None
+
+    payload = data[3:]
+    if data[2:3] == SIKISTIRMA_ZLIB:
+        payload = zlib.decompress(payload)
+    return codec, payload
+
+
+def encode_value(value) -> bytes:
+    """Değeri varsayılan codec ile (gerekirse sıkıştırarak) kodlar."""
+    return _paketle(VARSAYILAN_CODEC, VARSAYILAN_CODEC.encode(value))
+
+
+def decode_value(data: bytes):
+    """encode_value ile kodlanmış değeri çözer; çözülemezse None."""
+    codec, payload = _ac(data)
+    if codec is None:
         return None
-    return None
+    return codec.decode(payload)
+
+
+def cache_get(key: str):
+    data = _calistir(lambda r: r.get(key), _ERISILEMEDI)
+    if data is _ERISILEMEDI:
+        return None
+    value = _nesne_coz(data) if data else None
+    _say("hit" if value is not None else "miss")
+    return value
 
 def cache_set(key: str, value: dict, expire: int = 300):
-    if not REDIS_AVAILABLE or not redis_client:
+    try:
+        data = encode_value(value)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Önbellek değeri kodlanamadı ({key}): {e}")
         return
+    _calistir(lambda r: r.setex(key, expire, data))
+
+def _ham_json_coz(data: bytes):
+    """Saklanan değeri JSON bytes olarak döndürür; çözülemezse None."""
     try:
-        redis_client.setex(key, expire, json.dumps(value))
-    except:
-        pass
+        codec, payload = _ac(data)
+        if codec is not None and codec is not JsonCodec:
+            payload = JsonCodec.encode(codec.decode(payload))
+        return payload
+    except Exception:
+        return None
+
+def _ham_json_paketle(value) -> bytes:
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return _paketle(JsonCodec, value)
+
+def _nesne_coz(data: bytes):
+    try:
+        return decode_value(data)
+    except Exception:
+        return None
 
-def cache_delete_pattern(pattern: str):
+def cache_get_raw(key: str):
     """
-    Belirli bir pattern'e uyan (örn: 'tree:*') tüm keyleri siler.
+    Değeri JSON bytes olarak döndürür (Python nesnesine çözmeden).
+    Önceden serileştirilmiş yanıtları doğrudan istemciye göndermek için.
     """
-    if not REDIS_AVAILABLE or not redis_client:
+    data = _calistir(lambda r: r.get(key), _ERISILEMEDI)
+    if data is _ERISILEMEDI:
+        return None
+    payload = _ham_json_coz(data) if data else None
+    _say("hit" if payload is not None else "miss")
+    return payload
+
+def cache_set_raw(key: str, value, expire: int = 300):
+    """Önceden serileştirilmiş JSON'u (str veya bytes) olduğu gibi yazar."""
+    data = _ham_json_paketle(value)
+    _calistir(lambda r: r.setex(key, expire, data))
+
+def cache_delete(*keys: str):
+    """
+    Verilen keyleri siler (tek DEL komutu).
+    """
+    if not keys:
         return
+    _calistir(lambda r: r.delete(*keys))
+
+def cache_delete_pattern(pattern: str, batch_size: int = 500):
+    """
+    Belirli bir pattern'e uyan (örn: 'tree:*') tüm keyleri siler.
+    Bloklayan KEYS yerine SCAN ile parça parça tarar ve parti halinde siler.
+    Sıcak yollarda kullanılmamalı; bilinen keyler için cache_delete tercih edilir.
+    """
+    def _sil(r):
+        parti = []
+        for key in r.scan_iter(match=pattern, count=batch_size):
+            parti.append(key)
+            if len(parti) >= batch_size:
+                r.delete(*parti)
+                parti = []
+        if parti:
+            r.delete(*parti)
+
+    _calistir(_sil)
+
+# ---- Stampede Koruması (Single-Flight + Stale-While-Revalidate) ----
+#
+# Değer key altında (expire + bayat_sure) TTL ile, "key:taze" işareti ise
+# sadece expire TTL ile yazılır:
+# - İşaret varsa değer tazedir
+# - İşaret düşmüş ama değer duruyorsa: Tek bir istek (Redis kilidi alan)
+#   yeniden hesaplar, diğerleri bayat kopyayı hemen döner
+# - Değer hiç yoksa: Worker içinde key başına tek thread (diğerleri onun Event'ini
+#   bekler), worker'lar arasında Redis kilidi ile tek hesaplama yapılır; kilidi
+#   alamayanlar kısa süre sonucu bekler
+
+KILIT_SURESI = 30  # saniye - hesaplayan worker ölürse kilit kendiliğinden düşer
+KILIT_BEKLEME_SURESI = 2.0  # saniye - kilidi alamayan isteğin en fazla beklemesi
+KILIT_BEKLEME_ARALIGI = 0.05
+
+# Worker içi single-flight: Hesaplanmakta olan key -> bitince set edilen Event.
+# Global kilit sadece sözlük erişiminde tutulur; bekleme ve hesaplama kilitsizdir,
+# böylece farklı key'ler birbirini beklemez.
+_ucus_kilidi = threading.Lock()
+_ucustaki_keyler = {}
+
+# Kilidi sadece sahibi (token) silebilir
+_KILIT_BIRAK_LUA = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def _kilit_al(key: str):
+    """Yeniden hesaplama kilidini almayı dener; alınırsa token döner."""
+    token = uuid.uuid4().hex
+    if _calistir(lambda r: r.set(f"{key}:kilit", token, nx=True, ex=KILIT_SURESI)):
+        return token
+    return None
+
+
+def _kilit_birak(key: str, token: str) -> None:
+    _calistir(lambda r: r.eval(_KILIT_BIRAK_LUA, 1, f"{key}:kilit", token))
+
+
+def _taze_yaz(kayitlar, expire, bayat_sure):
+    """(key, kodlanmış değer) çiftlerini tazelik işaretleriyle tek pipeline'da yazar."""
+    def _yaz(r):
+        pipe = r.pipeline(transaction=False)
+        for key, data in kayitlar:
+            pipe.setex(key, expire + bayat_sure, data)
+            pipe.setex(f"{key}:taze", expire, b"1")
+        pipe.execute()
+
+    _calistir(_yaz)
+
+
+def _hesapla_ve_yaz(key, hesapla, paketle, expire, bayat_sure):
+    value = hesapla()
+    if value is not None:
+        _taze_yaz([(key, paketle(value))], expire, bayat_sure)
+    return value
+
+
+def _tek_ucus(key, hesapla, paketle, coz, expire, bayat_sure):
+    sonuc = _calistir(lambda r: r.mget(key, f"{key}:taze"), _ERISILEMEDI)
+    if sonuc is _ERISILEMEDI:
+        # Redis yok: Önbelleksiz hesapla
+        return hesapla()
+
+    data, taze = sonuc
+    value = coz(data) if data else None
+    if value is not None:
+        _say("hit")
+        if taze:
+            return value
+
+        # Bayat: Sadece kilidi alan yeniler, diğerleri bayat kopyayı döner
+        token = _kilit_al(key)
+        if token is None:
+            return value
+        try:
+            return _hesapla_ve_yaz(key, hesapla, paketle, expire, bayat_sure)
+        finally:
+            _kilit_birak(key, token)
+
+    _say("miss")
+    with _ucus_kilidi:
+        olay = _ucustaki_keyler.get(key)
+        lider = olay is None
+        if lider:
+            olay = _ucustaki_keyler[key] = threading.Event()
+
+    if not lider:
+        # Aynı worker'da bu key'i başka bir thread hesaplıyor - onun sonucunu bekle
+        olay.wait(KILIT_SURESI)
+        data = _calistir(lambda r: r.get(key))
+        value = coz(data) if data else None
+        if value is not None:
+            return value
+        # Lider sonuç yazamadı (hata / None / Redis erişilemedi): Kendisi hesaplar
+        return _hesapla_ve_yaz(key, hesapla, paketle, expire, bayat_sure)
+
     try:
-        keys = redis_client.keys(pattern)
-        if keys:
-            redis_client.delete(*keys)
-    except:
-        pass
+        # Aynı worker'daki başka bir thread az önce yazmış olabilir
+        data = _calistir(lambda r: r.get(key))
+        value = coz(data) if data else None
+        if value is not None:
+            return value
+
+        token = _kilit_al(key)
+        if token is None:
+            # Başka bir worker hesaplıyor - sonucu kısa süre bekle
+            bitis = time.monotonic() + KILIT_BEKLEME_SURESI
+            while time.monotonic() < bitis:
+                time.sleep(KILIT_BEKLEME_ARALIGI)
+                data = _calistir(lambda r: r.get(key))
+                value = coz(data) if data else None
+                if value is not None:
+                    return value
+            # Bekleme süresi doldu: Kendisi hesaplar (kilitsiz)
+            return _hesapla_ve_yaz(key, hesapla, paketle, expire, bayat_sure)
+
+        try:
+            return _hesapla_ve_yaz(key, hesapla, paketle, expire, bayat_sure)
+        finally:
+            _kilit_birak(key, token)
+    finally:
+        with _ucus_kilidi:
+            _ucustaki_keyler.pop(key, None)
+        olay.set()
+
+
+def cache_get_or_compute(key: str, hesapla, expire: int = 300, bayat_sure: int = 60):
+    """
+    Önbellekteki değeri döndürür; yoksa veya tazeliği geçtiyse hesapla() ile
+    (stampede korumalı) yeniden üretir. hesapla() None dönerse önbelleğe yazılmaz.
+
+    Args:
+        expire: Değerin taze sayıldığı süre (saniye)
+        bayat_sure: Tazelik bittikten sonra yenilenirken bayat kopyanın
+            sunulabileceği ek süre (saniye)
+    """
+    return _tek_ucus(key, hesapla, encode_value, _nesne_coz, expire, bayat_sure)
+
+
+def cache_set_many_fresh(degerler: dict, expire: int = 300, bayat_sure: int = 60):
+    """
+    Write-through: {key: değer} çiftlerini cache_get_or_compute ile uyumlu
+    biçimde (taze işaretiyle) tek pipeline'da yazar.
+    """
+    if degerler:
+        _taze_yaz([(key, encode_value(value)) for key, value in degerler.items()], expire, bayat_sure)
+
+
+def cache_get_or_compute_raw(key: str, hesapla, expire: int = 300, bayat_sure: int = 60):
+    """
+    cache_get_or_compute'un önceden serileştirilmiş JSON (bytes) sürümü.
+    hesapla() JSON str/bytes döndürmelidir; sonuç JSON bytes olarak döner.
+    """
+    def _hesapla_bytes():
+        value = hesapla()
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        return value
+
+    return _tek_ucus(key, _hesapla_bytes, _ham_json_paketle, _ham_json_coz, expire, bayat_sure)
+
 
 def is_jti_blocklisted(jti: str) -> bool:
     """
     JTI'nin blocklist'te olup olmadığını kontrol eder.
+    Redis erişilemezse (devre açık) False döner.
     """
-    if not REDIS_AVAILABLE or not redis_client:
-        return False
-    try:
-        return redis_client.exists(f"blocklist:{jti}") > 0
-    except:
-        return False
+    return bool(_calistir(lambda r: r.exists(f"blocklist:{jti}"), 0))
 
 def add_jti_to_blocklist(jti: str, expire: int = 86400):
     """
     JTI'yi blocklist'e ekler (varsayılan 24 saat).
     """
-    if not REDIS_AVAILABLE or not redis_client:
-        return
-    try:
-        redis_client.setex(f"blocklist:{jti}", expire, "1")
-    except:
-        pass
+    _calistir(lambda r: r.setex(f"blocklist:{jti}", expire, "1"))
+
+def publish_message(channel: str, message: str):
+    """
+    Pub/sub kanalına mesaj yayınlar (örn: önbellek invalidation).
+    """
+    _calistir(lambda r: r.publish(channel, message))
+
+_pubsub_client = None
+
+def get_pubsub():
+    """
+    Abonelik için yeni bir PubSub nesnesi döndürür. Redis erişilemezse None.
+    Mesaj verileri bytes olarak gelir.
+
+    Abonelik uzun süre mesajsız bekleyebildiği için komut havuzunun kısa
+    socket timeout'unu kullanmayan ayrı bir istemci kullanılır.
+    """
+    global _pubsub_client
+
+    if not REDIS_AVAILABLE:
+        return None
+    if _pubsub_client is None:
+        _pubsub_client = redis.Redis.from_url(
+            REDIS_URL,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+            health_check_interval=30,
+        )
+    return _pubsub_client.pubsub(ignore_subscribe_messages=True)
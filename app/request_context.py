@@ -0,0 +1,83 @@
+"""
+Request Context - İstek başına tembel (lazy) yüklenen kullanıcı bağlamı.
+
+auth_middleware sadece JWT claim'lerini çözer ve kullanıcı ID'sini bu nesneye
+koyar; veritabanına dokunmaz. request.state.user, request.state.cart_count ve
+request.state.site_ayarlar ilk erişildiklerinde yüklenir:
+
+- user: Tek primary key sorgusu (sadece erişilirse)
+- cart_count: Redis'teki sepet özetinden (crud.get_cart_item_count), yoksa tek aggregate sorgusu
+- site_ayarlar: Süreç içi ayar önbelleğinden (settings_cache)
+
+Böylece anonim istekler ve bu alanları kullanmayan JSON endpoint'leri
+middleware'de sıfır veritabanı sorgusu maliyetine sahiptir.
+
+Starlette'in request.state nesnesi scope["state"] sözlüğünü sarmaladığı için
+bu sınıf bir dict alt sınıfıdır; eksik anahtarlar __missing__ ile yüklenir.
+"""
+import logging
+from typing import Optional
+
+from app import crud, models, settings_cache
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class RequestContext(dict):
+    """request.state'in arkasındaki tembel yüklemeli sözlük"""
+
+    def __init__(self, mevcut: Optional[dict] = None, user_id: Optional[int] = None):
+        super().__init__(mevcut or {})
+        self.user_id = user_id
+        self.kullanici_bulunamadi = False
+        self._db = None
+
+    def __missing__(self, key):
+        if key == "user":
+            value = self._load_user()
+        elif key == "cart_count":
+            value = self._load_cart_count()
+        elif key == "site_ayarlar":
+            value = self._load_site_ayarlar()
+        else:
+            raise KeyError(key)
+
+        self[key] = value
+        return value
+
+    @property
+    def oturum_acik(self) -> bool:
+        """İstek sırasında tembel yükleme için bir oturum açıldı mı?"""
+        return self._db is not None
+
+    def close(self) -> None:
+        """İstek süresince açılan (varsa) veritabanı oturumunu kapatır."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _session(self):
+        # SessionLocal() bağlantıyı ilk sorguda açar
+        if self._db is None:
+            self._db = SessionLocal()
+        return self._db
+
+    def _load_user(self) -> Optional[models.Kullanici]:
+        if self.user_id is None:
+            return None
+
+        user = crud.get_user(self._session(), self.user_id)
+        if not user:
+            # Kullanıcı veritabanından silinmiş - middleware çerezi temizler
+            logger.warning(f"Token sahibi kullanıcı bulunamadı. User ID: {self.user_id}")
+            self.kullanici_bulunamadi = True
+        return user
+
+    def _load_cart_count(self) -> int:
+        if self.user_id is None:
+            return 0
+        return crud.get_cart_item_count(self._session(), self.user_id)
+
+    def _load_site_ayarlar(self) -> models.SiteAyarlari:
+        return settings_cache.get_site_ayarlari(self._session()) or models.SiteAyarlari()
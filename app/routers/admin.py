@@ -10,8 +10,9 @@ import json
 import time
 import sys
 from decimal import Decimal
-from app import models, crud, schemas
+from app import models, crud, schemas, settings_cache
 from app.dependencies import get_db, templates
+from app.services import CommissionService
 
 router = APIRouter()
 
@@ -21,7 +22,7 @@ async def bestsoft_login_page(request: Request):
     return templates.TemplateResponse("bestsoft_login.html", {"request": request})
 
 @router.post("/bestsoft/login")
-async def bestsoft_login_action(
+def bestsoft_login_action(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
@@ -186,7 +187,7 @@ def admin_slider_list(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.post("/admin/ayarlar/slider/ekle")
-async def admin_slider_add(
+def admin_slider_add(
     request: Request,
     baslik: str = Form(None),
     link: str = Form(None),
@@ -254,7 +255,7 @@ def admin_sertifika_list(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.post("/admin/ayarlar/sertifika/ekle")
-async def admin_sertifika_add(
+def admin_sertifika_add(
     request: Request,
     baslik: str = Form(None),
     aciklama: str = Form(None),
@@ -480,6 +481,7 @@ def admin_seo_update(
     ayarlar.seo_yazar = seo_yazar
     
     db.commit()
+    settings_cache.invalidate(settings_cache.SITE_AYARLARI)
     
     # Redirect back with success message
     return RedirectResponse(url="/admin/ayarlar/seo?success=true", status_code=303)
@@ -524,6 +526,7 @@ def admin_analytics_update(
     ayarlar.google_analytics_kodu = google_analytics_kodu
     
     db.commit()
+    settings_cache.invalidate(settings_cache.SITE_AYARLARI)
     
     return RedirectResponse(url="/admin/ayarlar/analytics?success=true", status_code=303)
 
@@ -590,6 +593,7 @@ def admin_firma_update(
     
 
     db.commit()
+    settings_cache.invalidate(settings_cache.SITE_AYARLARI)
     
     # Redirect back with success message
     return RedirectResponse(url="/admin/ayarlar/firma?success=true", status_code=303)
@@ -751,6 +755,7 @@ def admin_mlm_ayarlar_guncelle(
     crud.create_or_update_setting(db, "hosgeldin_bonusu", hosgeldin_bonusu)
     crud.create_or_update_setting(db, "kayit_pv", kayit_pv)
     crud.create_or_update_setting(db, "kayit_cv", kayit_cv)
+    settings_cache.invalidate(settings_cache.AYARLAR)
     
     return RedirectResponse(url="/admin/mlm/ayarlar?basari=1", status_code=303)
 
@@ -785,6 +790,7 @@ def admin_mlm_komisyon_guncelle(
     
     crud.create_or_update_setting(db, "kisa_kol_oran", kisa_kol_oran)
     crud.create_or_update_setting(db, "referans_orani", referans_orani)
+    settings_cache.invalidate(settings_cache.AYARLAR)
     
     return RedirectResponse(url="/admin/mlm/komisyon?basari=1", status_code=303)
 
@@ -842,6 +848,9 @@ def admin_mlm_nesil_guncelle(
 
     db.commit()
 
+    # Nesil oranları önbelleğini temizle
+    CommissionService.invalidate_generation_rates()
+
     return RedirectResponse(url="/admin/mlm/nesil?basari=1", status_code=303)
 
 # --- BONUS SİSTEMLERİ ---
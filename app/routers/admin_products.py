@@ -65,7 +65,7 @@ def product_add_page(request: Request, db: Session = Depends(get_db)):
 
 # --- YENİ ÜRÜN KAYDETME ---
 @router.post("/add")
-async def product_add_action(
+def product_add_action(
     ad: str = Form(...),
     sku: str = Form(None),
     barkod: str = Form(None),
@@ -128,7 +128,7 @@ def category_list(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.post("/categories/add")
-async def category_add(
+def category_add(
     ad: str = Form(...),
     ust_kategori_id: int = Form(None),
     aciklama: str = Form(None),
@@ -157,7 +157,7 @@ async def category_add(
     return RedirectResponse(url="/admin/products/categories", status_code=303)
 
 @router.post("/categories/update")
-async def category_update(
+def category_update(
     kategori_id: int = Form(...),
     ad: str = Form(...),
     ust_kategori_id: int = Form(None),
@@ -189,7 +189,7 @@ async def category_update(
     return RedirectResponse(url="/admin/products/categories", status_code=303)
 
 @router.post("/categories/delete")
-async def category_delete(kategori_id: int = Form(...), db: Session = Depends(get_db)):
+def category_delete(kategori_id: int = Form(...), db: Session = Depends(get_db)):
     category = db.get(models.Kategori, kategori_id)
     if category:
         # Opsiyonel: Kategoriye bağlı ürünlerin resimlerini de sil
@@ -211,7 +211,7 @@ def brand_list(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.post("/brands/add")
-async def brand_add(ad: str = Form(...), db: Session = Depends(get_db)):
+def brand_add(ad: str = Form(...), db: Session = Depends(get_db)):
     new_brand = models.Marka(ad=ad)
     db.add(new_brand)
     db.commit()
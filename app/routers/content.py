@@ -35,7 +35,7 @@ def admin_banners_page(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.post("/admin/content/banners/add")
-async def admin_banners_add(
+def admin_banners_add(
     request: Request,
     baslik: str = Form(...),
     aciklama: Optional[str] = Form(None),
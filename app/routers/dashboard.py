@@ -2,11 +2,13 @@ from fastapi import APIRouter, Depends, Request, HTTPException, UploadFile, File
 from sqlalchemy.orm import Session
 from starlette.responses import RedirectResponse, HTMLResponse, JSONResponse
 from app import models, crud, utils
-from app.dependencies import get_db, templates
+from app.dependencies import get_db, get_read_db, templates, run_db
 import os
+import logging
 from pathlib import Path
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.get("/panel/sponsor-olduklarim", response_class=HTMLResponse)
 def sponsor_olduklarim_sayfasi(request: Request, db: Session = Depends(get_db)):
@@ -42,7 +44,7 @@ def bekleyenler_sayfasi(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.get("/panel/{user_id}", response_class=HTMLResponse)
-def dashboard_sayfasi(request: Request, user_id: int, db: Session = Depends(get_db)):
+def dashboard_sayfasi(request: Request, user_id: int, db: Session = Depends(get_read_db)):
     # GÜVENLİK KONTROLÜ
     current_user = request.state.user
     if not current_user:
@@ -57,14 +59,14 @@ def dashboard_sayfasi(request: Request, user_id: int, db: Session = Depends(get_
     if not ozet_verisi:
         raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı!")
 
-    ekstre_verisi = db.query(models.CuzdanHareket).filter(
-        models.CuzdanHareket.user_id == user_id
-    ).order_by(models.CuzdanHareket.tarih.desc()).all()
+    # Ekstrenin sadece ilk sayfası; devamı /api/cuzdan/{user_id}/ekstre ile
+    ekstre_verisi, ekstre_imleci = crud.get_wallet_statement_page(db, user_id)
     
     return templates.TemplateResponse("dashboard.html", {
         "request": request, 
         "ozet": ozet_verisi, 
         "ekstre": ekstre_verisi,
+        "ekstre_imleci": ekstre_imleci,
         # Template içindeki değişken hatalarını önlemek için:
         "site_branding": {"site_name": "BestWork", "primary_color": "#7C3AED"},
         "t": lambda x: x, # Çeviri fonksiyonu desteği
@@ -74,9 +76,41 @@ def dashboard_sayfasi(request: Request, user_id: int, db: Session = Depends(get_
     })
 
 @router.get("/api/dashboard/{user_id}")
-def api_dashboard_getir(user_id: int, db: Session = Depends(get_db)):
+def api_dashboard_getir(user_id: int, db: Session = Depends(get_read_db)):
     return crud.get_dashboard_data(user_id, db)
 
+@router.get("/api/cuzdan/{user_id}/ekstre")
+def api_cuzdan_ekstre(
+    user_id: int,
+    request: Request,
+    imlec: str = None,
+    islem_tipi: str = None,
+    db: Session = Depends(get_read_db)
+):
+    """Cüzdan ekstresi - keyset sayfalama (imlec: önceki yanıttaki 'sonraki')."""
+    current_user = request.state.user
+    if not current_user or current_user.id != user_id:
+        raise HTTPException(status_code=401, detail="Yetkisiz işlem")
+
+    try:
+        hareketler, sonraki = crud.get_wallet_statement_page(db, user_id, imlec, islem_tipi=islem_tipi)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Geçersiz imleç")
+
+    return {
+        "hareketler": [
+            {
+                "id": h.id,
+                "miktar": float(h.miktar or 0),
+                "islem_tipi": h.islem_tipi,
+                "aciklama": h.aciklama,
+                "tarih": h.tarih.isoformat() if h.tarih else None
+            }
+            for h in hareketler
+        ],
+        "sonraki": sonraki
+    }
+
 @router.get("/career-tracking", response_class=HTMLResponse)
 def career_tracking_page(request: Request, db: Session = Depends(get_db)):
     user = request.state.user
@@ -130,7 +164,8 @@ async def upload_profile_image(
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
-    user = request.state.user
+    # request.state.user tembel yüklenir (DB sorgusu) - event loop dışında
+    user = await run_db(getattr, request.state, "user")
     if not user:
         raise HTTPException(status_code=401, detail="Oturum açmanız gerekiyor")
     
@@ -149,7 +184,8 @@ async def upload_profile_image(
         filename_prefix = f"{safe_name}_{user.id}"
         
         file_content = await file.read()
-        new_filename = utils.process_image_to_webp(
+        new_filename = await run_db(
+            utils.process_image_to_webp,
             file_content, 
             upload_dir, 
             filename_prefix
@@ -161,8 +197,17 @@ async def upload_profile_image(
     relative_path = f"/static/uploads/profiles/{new_filename}"
     
     # Kullanıcıyı yeniden sorgula (session attach için)
-    db_user = db.query(models.Kullanici).filter(models.Kullanici.id == user.id).first()
-    db_user.profil_resmi = relative_path
-    db.commit()
+    def _kaydet():
+        db_user = db.query(models.Kullanici).filter(models.Kullanici.id == user.id).first()
+        db_user.profil_resmi = relative_path
+        db.commit()
+        try:
+            crud.refresh_dashboard_summaries(db, [user.id])
+        except Exception as e:
+            # Resim kaydedildi; özet en geç TTL sonunda yenilenir
+            db.rollback()
+            logger.warning(f"Profil resmi sonrası dashboard önbelleği güncellenemedi: {e}")
+
+    await run_db(_kaydet)
     
     return JSONResponse({"success": True, "image_url": relative_path})
@@ -9,7 +9,7 @@ from sqlalchemy.orm import Session
 from typing import Optional
 import json
 
-from app.dependencies import get_db
+from app.dependencies import get_db, run_db
 from app import models
 from .admin import get_current_admin
 
@@ -151,23 +151,28 @@ async def public_form_submit(
     request: Request,
     db: Session = Depends(get_db)
 ):
-    form = db.query(models.Form).filter(models.Form.id == form_id).first()
-    if not form:
-        return RedirectResponse(url="/?error=form_not_found", status_code=303)
-
-    # Form verilerini al
+    # Form verilerini al (tek gerçek await; DB işleri threadpool'da)
     form_data = await request.form()
     cevaplar_dict = dict(form_data)
 
     # Üye ID'sini cookie'den al (varsa)
     uye_id = request.cookies.get("user_session")
 
-    cevap = models.FormCevap(
-        form_id=form_id,
-        uye_id=int(uye_id) if uye_id else None,
-        cevaplar=json.dumps(cevaplar_dict, ensure_ascii=False)
-    )
-    db.add(cevap)
-    db.commit()
+    def _kaydet() -> bool:
+        form = db.query(models.Form).filter(models.Form.id == form_id).first()
+        if not form:
+            return False
+
+        cevap = models.FormCevap(
+            form_id=form_id,
+            uye_id=int(uye_id) if uye_id else None,
+            cevaplar=json.dumps(cevaplar_dict, ensure_ascii=False)
+        )
+        db.add(cevap)
+        db.commit()
+        return True
+
+    if not await run_db(_kaydet):
+        return RedirectResponse(url="/?error=form_not_found", status_code=303)
 
     return RedirectResponse(url=f"/forms/{form_id}?success=submitted", status_code=303)
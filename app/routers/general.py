@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, Request, Form
 from sqlalchemy.orm import Session
 from starlette.responses import RedirectResponse, HTMLResponse
 from app import models, crud, schemas
+from app.services import EarningsService
 from app.dependencies import get_db, templates
 from datetime import datetime
 from zoneinfo import ZoneInfo
@@ -58,7 +59,7 @@ def kurumsal_sayfasi(request: Request):
 
 # --- VARİS İŞLEMLERİ ---
 @router.get("/varis-islemleri", response_class=HTMLResponse)
-async def varis_islemleri_sayfasi(request: Request, db: Session = Depends(get_db)):
+def varis_islemleri_sayfasi(request: Request, db: Session = Depends(get_db)):
     if not request.state.user:
         return RedirectResponse(url="/giris", status_code=302)
     
@@ -66,7 +67,7 @@ async def varis_islemleri_sayfasi(request: Request, db: Session = Depends(get_db
     return templates.TemplateResponse("varis_islemleri.html", {"request": request, "varis_members": varisler, "user": request.state.user, "page_title": "Varis İşlemleri"})
 
 @router.post("/varis-kaydet")
-async def save_varis(
+def save_varis(
     request: Request,
     entry_id: str = Form(None),
     name: str = Form(...),
@@ -110,7 +111,7 @@ async def save_varis(
     return RedirectResponse(url="/varis-islemleri", status_code=302)
 
 @router.post("/varis-sil")
-async def delete_varis(
+def delete_varis(
     request: Request,
     entry_id: int = Form(...),
     db: Session = Depends(get_db)
@@ -123,7 +124,7 @@ async def delete_varis(
 
 # --- BANKA BİLGİLERİ ---
 @router.get("/banka-bilgileri", response_class=HTMLResponse)
-async def banka_bilgileri_sayfasi(request: Request, db: Session = Depends(get_db)):
+def banka_bilgileri_sayfasi(request: Request, db: Session = Depends(get_db)):
     if not request.state.user:
         return RedirectResponse(url="/giris", status_code=302)
     
@@ -132,7 +133,7 @@ async def banka_bilgileri_sayfasi(request: Request, db: Session = Depends(get_db
     return templates.TemplateResponse("banka_bilgileri.html", {"request": request, "banka": banka, "page_title": "Banka Bilgilerim"})
 
 @router.post("/banka-bilgileri/kaydet")
-async def banka_bilgisi_kaydet(
+def banka_bilgisi_kaydet(
     request: Request,
     hesap_sahibi: str = Form(...),
     banka_adi: str = Form(...),
@@ -169,7 +170,7 @@ async def banka_bilgisi_kaydet(
 
 # --- ÜYELİK BİLGİLERİ ---
 @router.get("/uyelik-bilgileri", response_class=HTMLResponse)
-async def uyelik_bilgileri_sayfasi(request: Request, db: Session = Depends(get_db)):
+def uyelik_bilgileri_sayfasi(request: Request, db: Session = Depends(get_db)):
     if not request.state.user:
         return RedirectResponse(url="/giris", status_code=302)
     
@@ -197,7 +198,7 @@ async def uyelik_bilgileri_sayfasi(request: Request, db: Session = Depends(get_d
 
 # --- PRİM BİLGİLERİ ---
 @router.get("/prim-bilgileri", response_class=HTMLResponse)
-async def prim_bilgileri_sayfasi(request: Request, month: int = None, year: int = None, db: Session = Depends(get_db)):
+def prim_bilgileri_sayfasi(request: Request, month: int = None, year: int = None, db: Session = Depends(get_db)):
     if not request.state.user:
         return RedirectResponse(url="/giris", status_code=302)
     
@@ -205,17 +206,31 @@ async def prim_bilgileri_sayfasi(request: Request, month: int = None, year: int
         month = datetime.now().month
     if not year:
         year = datetime.now().year
+
+    # Aylık özet tablosundan tek primary key aralığı okuması
+    toplamlar = EarningsService.get_monthly_totals(db, request.state.user.id, int(year), int(month))
+
+    def _toplam(islem_tipi: str) -> float:
+        return float(toplamlar.get(islem_tipi, {}).get("toplam", 0))
+
+    kazanclar = {
+        "referans_bonusu": _toplam("REFERANS"),
+        "ciro_primi": _toplam("ESLESME"),
+        "liderlik_primi": _toplam("LIDERLIK"),
+        "aylik_toplam": sum(float(t["toplam"]) for t in toplamlar.values())
+    }
         
     return templates.TemplateResponse("priminfo.html", {
         "request": request,
         "current_month": int(month),
         "current_year": int(year),
+        "kazanclar": kazanclar,
         "page_title": "Prim Bilgileri"
     })
 
 # --- HIZLI BAŞLANGIÇ BONUSU ---
 @router.get("/hizli-baslangic", response_class=HTMLResponse)
-async def hizli_baslangic_sayfasi(request: Request, db: Session = Depends(get_db)):
+def hizli_baslangic_sayfasi(request: Request, db: Session = Depends(get_db)):
     if not request.state.user:
         return RedirectResponse(url="/giris", status_code=302)
     
@@ -252,18 +267,33 @@ async def hizli_baslangic_sayfasi(request: Request, db: Session = Depends(get_db
 
 # --- REFERANS BONUSU ---
 @router.get("/referans-bonusu", response_class=HTMLResponse)
-async def referans_bonusu_sayfasi(request: Request, db: Session = Depends(get_db)):
+def referans_bonusu_sayfasi(request: Request, month: int = None, year: int = None, db: Session = Depends(get_db)):
     if not request.state.user:
         return RedirectResponse(url="/giris", status_code=302)
     
-    # Şimdilik boş veri gönderiyoruz
-    kayitlar = []
-    toplam_kazanc = sum(k["kazanc"] for k in kayitlar) if kayitlar else 0.0
-    
     # Tarih filtreleri için varsayılan değerler
     current_date = datetime.now()
-    current_month = current_date.month
-    current_year = current_date.year
+    current_month = int(month) if month else current_date.month
+    current_year = int(year) if year else current_date.year
+
+    user_id = request.state.user.id
+
+    # Aylık toplam özet tablosundan
+    toplamlar = EarningsService.get_monthly_totals(db, user_id, current_year, current_month)
+    toplam_kazanc = float(toplamlar.get("REFERANS", {}).get("toplam", 0))
+
+    kayitlar = []
+    if toplam_kazanc:
+        # Ay detayı; yeni üye bilgisi hareketin kaynak_user_id'si üzerinden gelir
+        kayitlar = [
+            {
+                "uye_no": h["uye_no"] or "-",
+                "ad_soyad": h["ad_soyad"] or "-",
+                "tarih": h["tarih"],
+                "kazanc": float(h["miktar"])
+            }
+            for h in EarningsService.get_monthly_transactions(db, user_id, current_year, current_month, "REFERANS")
+        ]
     
     return templates.TemplateResponse("referans_bonusu.html", {
         "request": request,
@@ -276,7 +306,7 @@ async def referans_bonusu_sayfasi(request: Request, db: Session = Depends(get_db
 
 # --- ANLIK EŞLEŞME SAYFASI ---
 @router.get("/anlik-eslesme", response_class=HTMLResponse)
-async def anlik_eslesme_sayfasi(request: Request, db: Session = Depends(get_db)):
+def anlik_eslesme_sayfasi(request: Request, month: int = None, year: int = None, db: Session = Depends(get_db)):
     if not request.state.user:
         return RedirectResponse(url="/giris", status_code=302)
     
@@ -290,17 +320,24 @@ async def anlik_eslesme_sayfasi(request: Request, db: Session = Depends(get_db))
     eslesecek_puan = min(sol_pv, sag_pv)
     olasi_kazanc = eslesecek_puan * 0.13
     
-    # Geçmiş Eşleşme Hareketleri (Şimdilik boş list veya mock data)
-    # Burada Cüzdan Hareketleri tablosundan "ESLESME" tipindeki kayıtları çekmek gerekir.
-    # eslesmeler = db.query(models.CuzdanHareket).filter(...)
-    
     # Tarih filtreleri için varsayılan değerler
     current_date = datetime.now()
-    current_month = current_date.month
-    current_year = current_date.year
+    current_month = int(month) if month else current_date.month
+    current_year = int(year) if year else current_date.year
     
-    eslesmeler = [] # Boş liste şimdilik
-    toplam_kazanc = sum(e.get("kazanc", 0) for e in eslesmeler)
+    # Seçilen ayın eşleşme toplamı aylık özet tablosundan
+    toplamlar = EarningsService.get_monthly_totals(db, user.id, current_year, current_month)
+    toplam_kazanc = float(toplamlar.get("ESLESME", {}).get("toplam", 0))
+    eslesmeler = []
+    if toplam_kazanc:
+        eslesmeler = [
+            {
+                "tarih": h["tarih"],
+                "aciklama": h["aciklama"],
+                "kazanc": float(h["miktar"])
+            }
+            for h in EarningsService.get_monthly_transactions(db, user.id, current_year, current_month, "ESLESME")
+        ]
     
     return templates.TemplateResponse("anlik_eslesme.html", {
         "request": request,
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, Request, Form
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 from app.dependencies import get_db, templates
-from app import crud, models
+from app import crud, models, settings_cache
 import uuid
 
 router = APIRouter()
@@ -22,7 +22,7 @@ def anasayfa(request: Request, db: Session = Depends(get_db)):
 
 @router.get("/iletisim", response_class=HTMLResponse)
 def iletisim_sayfasi(request: Request, db: Session = Depends(get_db)):
-    ayarlar = db.query(models.SiteAyarlari).first()
+    ayarlar = settings_cache.get_site_ayarlari(db)
     return templates.TemplateResponse("iletisim.html", {
         "request": request,
         "page_title": "İletişim",
@@ -52,7 +52,7 @@ def iletisim_formu_gonder(
     db.commit()
     db.refresh(yeni_mesaj)
     
-    ayarlar = db.query(models.SiteAyarlari).first()
+    ayarlar = settings_cache.get_site_ayarlari(db)
     
     return templates.TemplateResponse("iletisim.html", {
         "request": request,
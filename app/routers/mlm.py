@@ -1,20 +1,37 @@
-from fastapi import APIRouter, Depends, Request, HTTPException, Form
+import json
+
+from fastapi import APIRouter, Depends, Request, HTTPException, Form, Query
 from sqlalchemy.orm import Session
-from starlette.responses import JSONResponse, RedirectResponse, HTMLResponse
-from app import models, crud
-from app.dependencies import get_db, templates
-from app.redis_client import cache_get, cache_set, cache_delete_pattern # Redis istemcisi
+from starlette.responses import JSONResponse, RedirectResponse, HTMLResponse, Response
+from app import models, crud, schemas
+from app.database import primary_oturumu
+from app.dependencies import get_db, get_read_db, templates
+from app.redis_client import cache_get_or_compute_raw # Redis istemcisi
+from app.services.binary_service import (
+    BinaryTreeService, AGAC_CACHE_DERINLIGI, AGAC_CACHE_TTL, AGAC_CACHE_BAYAT_SURE, agac_cache_key
+)
 
 router = APIRouter()
 
+# Alt ağaç genişletmede tek istekte açılabilecek maksimum seviye
+MAX_GENISLETME_DERINLIGI = 6
+
+# Düğümün children listesindeki sırası
+_COCUK_INDEKSI = {"SOL": 0, "SAG": 1}
+
 
 def _build_tree_from_flat_data(nodes_data: list, root_id: int, max_depth: int = 3) -> dict:
     """
     Düz liste verisinden hiyerarşik ağaç yapısını oluşturur.
     CTE sorgusu sonucu tek seferde gelen veriyi ağaca dönüştürür.
 
+    Recursive değildir: Satırlar derinlik sırasıyla geldiği için parent her
+    zaman çocuğundan önce oluşturulur; her düğüm tek geçişte parent'ının
+    children listesindeki boş yerin üzerine yazılır. Yüz binlerce düğümde
+    de recursion limiti yoktur.
+
     Args:
-        nodes_data: CTE'den gelen düğüm listesi
+        nodes_data: get_tree_rows_cte satırları (derinlik sıralı)
         root_id: Kök kullanıcı ID'si
         max_depth: Maksimum ağaç derinliği
 
@@ -24,68 +41,89 @@ def _build_tree_from_flat_data(nodes_data: list, root_id: int, max_depth: int =
     if not nodes_data:
         return None
 
-    # ID'ye göre hızlı erişim için index oluştur
-    nodes_by_id = {node["id"]: node for node in nodes_data}
-
-    # Her node için children listesi oluştur
-    children_map = {}
-    for node in nodes_data:
-        parent_id = node["parent_id"]
-        if parent_id not in children_map:
-            children_map[parent_id] = {"SOL": None, "SAG": None}
-        if node["kol"]:
-            children_map[parent_id][node["kol"]] = node["id"]
+    dugumler = {}
+    for row in nodes_data:
+        node_id = row.id
 
-    def build_subtree(node_id, current_depth=0):
-        if node_id not in nodes_by_id:
-            return None
-
-        node = nodes_by_id[node_id]
-
-        # Derinlik kontrolü
-        if current_depth > max_depth:
-            return {
+        # Derinlik kontrolü - sınırın altındaki düğüm /api/tree/alt ile açılır
+        if row.depth > max_depth:
+            dugum = {
                 "name": "Daha Fazla...",
                 "id": node_id,
                 "uye_no": "",
-                "pv": "",
                 "children": [],
                 "expandable": True
             }
+        else:
+            # PV etiketi frontend'de oluşturulur (düğüm başına string üretilmez)
+            dugum = {
+                "name": row.tam_ad,
+                "id": node_id,
+                "uye_no": row.uye_no,
+                "sol_pv": row.sol_pv or 0,
+                "sag_pv": row.sag_pv or 0,
+                "children": [
+                    {"name": "Boş", "id": None, "kol": "SOL", "parent": node_id},
+                    {"name": "Boş", "id": None, "kol": "SAG", "parent": node_id}
+                ]
+            }
+        dugumler[node_id] = dugum
 
-        sol_pv = node.get("sol_pv", 0) or 0
-        sag_pv = node.get("sag_pv", 0) or 0
+        if node_id != root_id:
+            parent = dugumler.get(row.parent_id)
+            if parent is not None and row.kol in _COCUK_INDEKSI:
+                parent["children"][_COCUK_INDEKSI[row.kol]] = dugum
 
-        # Çocukları bul
-        children_info = children_map.get(node_id, {"SOL": None, "SAG": None})
-        sol_child_id = children_info["SOL"]
-        sag_child_id = children_info["SAG"]
+    return dugumler.get(root_id)
 
-        # Sol ve sağ çocukları oluştur
-        sol_child = None
-        sag_child = None
 
-        if sol_child_id:
-            sol_child = build_subtree(sol_child_id, current_depth + 1)
-        if sag_child_id:
-            sag_child = build_subtree(sag_child_id, current_depth + 1)
+def _alt_agac_getir(db: Session, root_id: int, derinlik: int):
+    """
+    root_id altındaki `derinlik` seviyelik ağacı getirir.
 
-        return {
-            "name": node["tam_ad"],
-            "id": node["id"],
-            "uye_no": node["uye_no"],
-            "pv": f"Sol: {sol_pv} | Sağ: {sag_pv}",
-            "children": [
-                sol_child if sol_child else {"name": "Boş", "id": None, "kol": "SOL", "parent": node_id},
-                sag_child if sag_child else {"name": "Boş", "id": None, "kol": "SAG", "parent": node_id}
-            ]
-        }
+    CTE bir seviye fazla çekilir: Sınırın altındaki düğümler "Daha Fazla..."
+    (expandable) olarak döner ve frontend bunların id'siyle /api/tree/alt/{id}
+    çağırarak alt ağacı parça parça açar.
 
-    return build_subtree(root_id)
+    Varsayılan derinlikteki sonuçlar agac_cache_key(root_id) altında önbelleğe
+    alınır (kök ağaç ile aynı veri; invalidation aynı anahtarları siler).
+    """
+    def _hesapla(oturum: Session):
+        # === CTE İLE ALT AĞACI TEK SEFERDE GETİR ===
+        # Bu sorgu N+1 problemini tamamen ortadan kaldırır
+        tree_nodes = BinaryTreeService.get_tree_rows_cte(oturum, root_id, derinlik + 1)
+
+        # Düz veriyi hiyerarşik ağaca dönüştür
+        tree_data = _build_tree_from_flat_data(tree_nodes, root_id, derinlik)
+        if tree_data is None:
+            # Kullanıcı bulunamadı
+            return None
 
+        # Tek seferde kompakt JSON'a çevrilir; aynı bytes hem yanıt hem önbellek olur
+        # (FastAPI'nin jsonable_encoder ile düğüm düğüm dolaşması atlanır)
+        return json.dumps(tree_data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    if derinlik == AGAC_CACHE_DERINLIGI:
+        def _primaryden_hesapla():
+            # Paylaşılan önbellek replikadan doldurulmaz (gecikmeli ağaç TTL boyunca
+            # herkese sunulurdu); replika yoksa isteğin oturumu kullanılır
+            with primary_oturumu(db) as oturum:
+                return _hesapla(oturum)
+
+        # Popüler liderin ağacı: Tek worker yeniden hesaplar, diğerleri bayat kopyayı sunar
+        payload = cache_get_or_compute_raw(
+            agac_cache_key(root_id), _primaryden_hesapla,
+            expire=AGAC_CACHE_TTL, bayat_sure=AGAC_CACHE_BAYAT_SURE
+        )
+    else:
+        payload = _hesapla(db)
+
+    if payload is None:
+        return None
+    return Response(content=payload, media_type="application/json")
 
 @router.get("/api/tree/{user_id}")
-def get_tree_data(user_id: int, request: Request, db: Session = Depends(get_db)):
+def get_tree_data(user_id: int, request: Request, db: Session = Depends(get_read_db)):
     """
     Binary ağaç verisini getirir - CTE ile optimize edildi.
 
@@ -100,37 +138,37 @@ def get_tree_data(user_id: int, request: Request, db: Session = Depends(get_db))
     if not request.state.user:
         raise HTTPException(status_code=401, detail="Giriş yapmalısınız")
 
-    # 1. ÖNCE REDIS CACHE KONTROL EDİLİR
-    cache_key = f"tree_data:{user_id}"
-    cached_data = cache_get(cache_key)
-    if cached_data:
-        # Cache Hit - Log (İsteğe bağlı)
-        print(f"⚡️ Redis Cache'den Çekildi: {user_id}")
-        return cached_data
-
-    # Kendi ağacını veya admin ise herkesi
+    # Kendi ağacını veya admin ise herkesi (önbellekten önce kontrol edilir)
     if request.state.user.id != user_id:
         raise HTTPException(status_code=403, detail="Yetkisiz erişim")
 
-    # Derinlik Limiti (Performans için)
-    MAX_DEPTH = 3
+    # Derinlik Limiti (Performans için) - önbellek invalidation'ı bu derinliğe göre yapılır
+    return _alt_agac_getir(db, user_id, AGAC_CACHE_DERINLIGI)
 
-    # === CTE İLE TÜM AĞACI TEK SEFERDE GETİR ===
-    # Bu sorgu N+1 problemini tamamen ortadan kaldırır
-    tree_nodes = crud.agac_verisi_getir_cte(db, user_id, MAX_DEPTH)
+@router.get("/api/tree/alt/{node_id}")
+def get_subtree_data(
+    node_id: int,
+    request: Request,
+    derinlik: int = Query(AGAC_CACHE_DERINLIGI, ge=1, le=MAX_GENISLETME_DERINLIGI),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Alt ağaç genişletme (lazy loading).
 
-    if not tree_nodes:
-        # Kullanıcı bulunamadı
-        return None
+    İstenen düğümün altındaki `derinlik` seviyeyi döner; sınırdaki düğümler
+    tekrar "expandable" işaretlenir. Böylece frontend tüm ağacı hiç yüklemeden
+    20+ seviyeyi adım adım gezebilir.
 
-    # Düz veriyi hiyerarşik ağaca dönüştür
-    tree_data = _build_tree_from_flat_data(tree_nodes, user_id, MAX_DEPTH)
+    Yetki: Düğüm çağıranın kendisi veya binary alt ağacında olmalıdır
+    (kullanici_agac_yollari üzerinde tek primary key lookup).
+    """
+    if not request.state.user:
+        raise HTTPException(status_code=401, detail="Giriş yapmalısınız")
 
-    # 2. REDIS'E KAYDET (5 Dakika = 300 saniye Ömrü)
-    if tree_data:
-        cache_set(cache_key, tree_data, expire=300)
+    if not BinaryTreeService.is_in_downline(db, request.state.user.id, node_id):
+        raise HTTPException(status_code=403, detail="Yetkisiz erişim")
 
-    return tree_data
+    return _alt_agac_getir(db, node_id, derinlik)
 
 @router.get("/api/bekleyen-uyeler/{user_id}")
 def get_bekleyen_uyeler(user_id: int, request: Request, db: Session = Depends(get_db)):
@@ -176,22 +214,44 @@ def yerlestir_api(
         return JSONResponse(status_code=403, content={"success": False, "message": "Bu üyeyi yerleştirme yetkiniz yok!"})
 
     try:
+        # Önbellek temizliği yerleştirme servisinde yapılır:
+        # Sadece AGAC_CACHE_DERINLIGI mesafedeki ataların ağaç cache'i silinir.
         crud.uyeyi_agaca_yerlestir(db, uye_id, parent_id, kol)
         
-        # 3. CACHE INVALIDATION (Önbellek Temizliği)
-        # Ağaç yapısı değiştiği için bu kullanıcının ve üst sponsorların cache'i silinmeli
-        # Basit yaklaşım: O anki kullanıcının cache'ini sil.
-        # Daha iyi yaklaşım: Tüm ağaç cache'lerini sil (Wildcard ile) çünkü binary ağacı herkesi etkiler.
-        cache_delete_pattern("tree_data:*")
-        
         return {"success": True, "message": "Üye başarıyla yerleştirildi."}
     except HTTPException as e:
         return JSONResponse(status_code=e.status_code, content={"success": False, "message": e.detail})
     except Exception as e:
         return JSONResponse(status_code=500, content={"success": False, "message": str(e)})
 
+@router.post("/api/yerlestir/toplu")
+def toplu_yerlestir_api(
+    request: Request,
+    istek: schemas.TopluYerlesimIstegi,
+    db: Session = Depends(get_db)
+):
+    if not request.state.user:
+        return JSONResponse(status_code=401, content={"success": False, "message": "Giriş yapmalısınız"})
+
+    try:
+        # Yetki (sadece kendi bekleyen üyeleri) servis içinde kalem bazında kontrol edilir
+        sonuclar = BinaryTreeService.place_users_bulk(
+            db, request.state.user.id, [kalem.dict() for kalem in istek.yerlesimler]
+        )
+        yerlesen = sum(1 for sonuc in sonuclar if sonuc["success"])
+
+        return {
+            "success": yerlesen > 0,
+            "message": f"{yerlesen} / {len(sonuclar)} üye yerleştirildi.",
+            "sonuclar": sonuclar
+        }
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "message": e.detail})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"success": False, "message": str(e)})
+
 @router.get("/panel/agac/{user_id}", response_class=HTMLResponse)
-def tree_page(request: Request, user_id: int, db: Session = Depends(get_db)):
+def tree_page(request: Request, user_id: int, db: Session = Depends(get_read_db)):
     # GÜVENLİK KONTROLÜ
     current_user = request.state.user
     if not current_user:
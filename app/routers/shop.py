@@ -14,7 +14,7 @@ from sqlalchemy.orm import Session
 from starlette.responses import RedirectResponse, HTMLResponse
 
 from app import models, crud
-from app.dependencies import get_db, templates
+from app.dependencies import get_db, get_read_db, templates
 from app.services import OrderService
 
 router = APIRouter()
@@ -22,7 +22,7 @@ router = APIRouter()
 
 # KATEGORİ SAYFASI
 @router.get("/kategori/{kategori_id}", response_class=HTMLResponse)
-def kategori_sayfasi(request: Request, kategori_id: int, db: Session = Depends(get_db)):
+def kategori_sayfasi(request: Request, kategori_id: int, db: Session = Depends(get_read_db)):
     """Kategori sayfası - Belirli bir kategorideki ürünleri listeler."""
     # Repository katmanı: Sadece veri çekme
     kategori = crud.kategori_getir(db, kategori_id)
@@ -43,7 +43,7 @@ def kategori_sayfasi(request: Request, kategori_id: int, db: Session = Depends(g
 
 # ÜRÜN DETAY
 @router.get("/urun/{urun_id}", response_class=HTMLResponse)
-def urun_detay(request: Request, urun_id: int, db: Session = Depends(get_db)):
+def urun_detay(request: Request, urun_id: int, db: Session = Depends(get_read_db)):
     """Ürün detay sayfası."""
     # Repository katmanı: Sadece veri çekme
     urun = crud.urun_getir(db, urun_id)
@@ -170,7 +170,7 @@ def siparisler_sayfasi(request: Request, kullanici_id: int, db: Session = Depend
 
 # MAĞAZA (TÜM ÜRÜNLER)
 @router.get("/urunler", response_class=HTMLResponse)
-def magaza_sayfasi(request: Request, db: Session = Depends(get_db)):
+def magaza_sayfasi(request: Request, db: Session = Depends(get_read_db)):
     """Ana mağaza sayfası - Tüm ürünleri listeler."""
     # Repository katmanı: Sadece veri çekme
     kategoriler = crud.kategorileri_listele(db)
@@ -64,6 +64,16 @@ class AgacYapisi(BaseModel):
     class Config:
         from_attributes = True
 
+# Toplu yerleştirme: kol verilmezse sponsorun zayıf koluna taşmalı (spillover) yerleşir.
+# parent_id verilmezse seçilen kolun en dışındaki boş yere yerleşir.
+class TopluYerlesimKalemi(BaseModel):
+    uye_id: int
+    kol: Optional[KolSecimi] = None
+    parent_id: Optional[int] = None
+
+class TopluYerlesimIstegi(BaseModel):
+    yerlesimler: list[TopluYerlesimKalemi]
+
 class DashboardOzet(BaseModel):
     id: int
     tam_ad: str
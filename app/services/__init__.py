@@ -10,23 +10,27 @@ Her servis, belirli bir domain sorumluluğunu yönetir:
 - BinaryTreeService: Binary ağaç yerleşimi ve hiyerarşi yönetimi
 - OrderService: Sipariş oluşturma ve işleme
 - RegistrationService: Kullanıcı kayıt işlemleri
+- EarningsService: Aylık kazanç özetleri (prim sayfaları)
 
 Tüm servisler static metodlar kullanır ve state-less'tir (durum tutmazlar).
 Bu yaklaşım test edilebilirliği ve bakımı kolaylaştırır.
 """
 
 from .economy_service import EconomyService
-from .commission_service import CommissionService
+from .commission_service import CommissionService, KomisyonDefteri
 from .rank_service import RankService
 from .binary_service import BinaryTreeService
 from .order_service import OrderService
 from .registration_service import RegistrationService
+from .earnings_service import EarningsService
 
 __all__ = [
     "EconomyService",
     "CommissionService",
+    "KomisyonDefteri",
     "RankService",
     "BinaryTreeService",
     "OrderService",
-    "RegistrationService"
+    "RegistrationService",
+    "EarningsService"
 ]
\ No newline at end of file
@@ -6,31 +6,57 @@ Bu servis, MLM sistemindeki binary (ikili) ağaç yapısının yönetiminden sor
 """
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
 import logging
 from typing import List, Dict, Optional
 
-from app import models
+from app import models, crud
+from app.redis_client import cache_delete
 
 logger = logging.getLogger(__name__)
 
+# Dış hat yürüyüşünde döngü koruması (bozuk parent_id zincirine karşı)
+MAX_DIS_HAT_DERINLIGI = 100000
+
+# Taşmalı (spillover) yerleşimde yarış kaybedildiğinde en fazla deneme sayısı
+YERLESIM_DENEME_SAYISI = 5
+# Toplu yerleştirmede tek istekteki maksimum üye sayısı
+TOPLU_YERLESIM_LIMITI = 500
+
+# /api/tree önbelleği: Her kullanıcı için kökten itibaren bu derinliğe kadar
+# düğümler önbelleğe alınır. Bir düğümdeki değişiklik sadece bu mesafedeki
+# ataların önbelleğini etkiler.
+AGAC_CACHE_DERINLIGI = 3
+AGAC_CACHE_TTL = 300  # saniye
+# TTL dolduktan sonra yeniden hesaplanırken bayat kopyanın sunulabileceği süre
+AGAC_CACHE_BAYAT_SURE = 60  # saniye
+
+
+def agac_cache_key(user_id: int) -> str:
+    # v2: Kompakt JSON, PV etiketi yerine sol_pv/sag_pv alanları
+    return f"tree_data:v2:{user_id}"
+
 
 class BinaryTreeService:
     """Binary ağaç yönetim servisi"""
 
     @staticmethod
-    def get_tree_data_cte(db: Session, root_user_id: int, max_depth: int = 3) -> List[Dict]:
+    def get_tree_rows_cte(db: Session, root_user_id: int, max_depth: int = 3) -> list:
         """
-        CTE (Common Table Expression) kullanarak binary ağacın tüm verilerini
+        CTE (Common Table Expression) kullanarak binary ağacın tüm düğümlerini
         tek sorguda getirir. N+1 sorgu problemini önler.
 
+        Satırlar dict'e çevrilmeden (hafif Row tuple'ları olarak) ve derinlik
+        sırasıyla döner; büyük alt ağaçlarda düğüm başına ek nesne oluşmaz.
+
         Args:
             db: Database session
             root_user_id: Kök kullanıcı ID'si
             max_depth: Maksimum derinlik
 
         Returns:
-            Ağaç düğümleri listesi (düz liste halinde)
+            (id, tam_ad, uye_no, parent_id, kol, sol_pv, sag_pv, depth) satırları
         """
         # Recursive CTE sorgusu - Tek sorguda tüm ağacı getirir
         cte_query = text("""
@@ -64,31 +90,15 @@ class BinaryTreeService:
                 INNER JOIN binary_tree bt ON k.parent_id = bt.id
                 WHERE bt.depth < :max_depth
             )
-            SELECT * FROM binary_tree;
+            SELECT * FROM binary_tree ORDER BY depth;
         """)
 
         try:
-            result = db.execute(cte_query, {
+            return db.execute(cte_query, {
                 "root_user_id": root_user_id,
                 "max_depth": max_depth
             }).fetchall()
 
-            # Sonuçları dict listesine dönüştür
-            tree_nodes = []
-            for row in result:
-                tree_nodes.append({
-                    "id": row.id,
-                    "tam_ad": row.tam_ad,
-                    "uye_no": row.uye_no,
-                    "parent_id": row.parent_id,
-                    "kol": row.kol,
-                    "sol_pv": row.sol_pv or 0,
-                    "sag_pv": row.sag_pv or 0,
-                    "depth": row.depth
-                })
-
-            return tree_nodes
-
         except Exception as e:
             logger.error(f"Ağaç verisi çekilirken hata: {e}")
             raise HTTPException(
@@ -96,23 +106,56 @@ class BinaryTreeService:
                 detail=f"Ağaç verisi alınamadı: {str(e)}"
             )
 
+    @staticmethod
+    def get_tree_data_cte(db: Session, root_user_id: int, max_depth: int = 3) -> List[Dict]:
+        """
+        get_tree_rows_cte sonucunu dict listesi olarak döndürür.
+
+        Returns:
+            Ağaç düğümleri listesi (düz liste halinde)
+        """
+        return [
+            {
+                "id": row.id,
+                "tam_ad": row.tam_ad,
+                "uye_no": row.uye_no,
+                "parent_id": row.parent_id,
+                "kol": row.kol,
+                "sol_pv": row.sol_pv or 0,
+                "sag_pv": row.sag_pv or 0,
+                "depth": row.depth
+            }
+            for row in BinaryTreeService.get_tree_rows_cte(db, root_user_id, max_depth)
+        ]
+
     @staticmethod
     def place_user_in_tree(
         db: Session,
         user_id: int,
         parent_id: int,
-        kol: str
-    ) -> None:
+        kol: str,
+        tasma: bool = False
+    ) -> int:
         """
         Kullanıcıyı binary ağaca yerleştirir.
 
         Bu işlem atomic'tir - ya tamamen başarılı olur ya da hiç olmaz.
+        Eşzamanlı yerleşimlere karşı güvenlidir: Kullanıcı, hedef parent ve
+        parent'ın tüm ataları (sayaçları güncellenecek satırlar) id sırasıyla
+        kilitlenir; kol boşluğu kilit altında kontrol edilir. Sabit kilit sırası
+        yerleşimler arası deadlock'u önler; (parent_id, kol) unique indeksi son
+        güvencedir.
 
         Args:
             db: Database session
             user_id: Yerleştirilecek kullanıcı ID
             parent_id: Üst kullanıcı (parent) ID
             kol: Hangi kola yerleşecek ("SOL" veya "SAG")
+            tasma: True ise kol doluysa o kolun en dışındaki boş yere yerleştirir
+                (spillover); yarışta kaybedilirse sıradaki boş yerle tekrar dener
+
+        Returns:
+            Yerleştirildiği parent'ın ID'si
 
         Raises:
             HTTPException: Yerleştirme başarısız olursa
@@ -124,68 +167,374 @@ class BinaryTreeService:
                 detail="Kol sadece 'SOL' veya 'SAG' olabilir."
             )
 
-        # Kullanıcıyı getir
-        user = db.query(models.Kullanici).filter(
-            models.Kullanici.id == user_id
-        ).first()
+        for deneme in range(YERLESIM_DENEME_SAYISI):
+            hedef_id = BinaryTreeService.find_empty_spot(db, parent_id, kol) if tasma else parent_id
+
+            try:
+                kilitli = BinaryTreeService._yerlesim_kilitle(db, [user_id], [hedef_id])
+
+                if user_id not in kilitli:
+                    raise HTTPException(
+                        status_code=404,
+                        detail="Kullanıcı bulunamadı."
+                    )
+
+                if hedef_id not in kilitli:
+                    raise HTTPException(
+                        status_code=404,
+                        detail="Üst kullanıcı (parent) bulunamadı."
+                    )
+
+                # Kilit alındıktan sonra güncel satırı oku
+                user = db.query(models.Kullanici).filter(
+                    models.Kullanici.id == user_id
+                ).populate_existing().first()
+
+                # Zaten yerleştirilmiş mi?
+                if user.parent_id is not None:
+                    raise HTTPException(
+                        status_code=400,
+                        detail="Bu kullanıcı zaten ağaca yerleştirilmiş."
+                    )
+
+                # Seçilen kol dolu mu? (parent kilitliyken başka yerleşim araya giremez)
+                kol_dolu = db.query(models.Kullanici.id).filter(
+                    models.Kullanici.parent_id == hedef_id,
+                    models.Kullanici.kol == kol
+                ).first()
+
+                if kol_dolu:
+                    if tasma:
+                        # Boş yer bulunduktan sonra başka yerleşim doldurdu; yeniden ara
+                        db.rollback()
+                        continue
+                    parent = db.query(models.Kullanici.tam_ad).filter(models.Kullanici.id == hedef_id).first()
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"{parent.tam_ad} kullanıcısının {kol} kolu zaten dolu!"
+                    )
+
+                # Kullanıcıyı yerleştir
+                user.parent_id = hedef_id
+                user.kol = kol
+                db.flush()
+
+                # Ata-torun indeksini aynı transaction içinde güncelle
+                BinaryTreeService._link_ancestry(db, user_id, hedef_id, kol)
+                BinaryTreeService._bump_leg_counters(
+                    db, user_id, 1 + (user.sol_ekip_sayisi or 0) + (user.sag_ekip_sayisi or 0)
+                )
 
-        if not user:
-            raise HTTPException(
-                status_code=404,
-                detail="Kullanıcı bulunamadı."
+                db.commit()
+
+            except HTTPException:
+                db.rollback()
+                raise
+
+            except IntegrityError as e:
+                # Kilitleri atlayan bir yazım (parent_id, kol) indeksine takıldı
+                db.rollback()
+                if tasma:
+                    logger.warning(f"Yerleşim çakışması, tekrar deneniyor. User ID: {user_id}, Parent ID: {hedef_id}")
+                    continue
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Seçilen {kol} kolu zaten dolu!"
+                ) from e
+
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Ağaca yerleştirme sırasında hata: {e}")
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Yerleştirme işlemi başarısız: {str(e)}"
+                )
+
+            db.refresh(user)
+            BinaryTreeService._yerlesim_onbellegini_guncelle(db, [user.id], [user.referans_id])
+
+            logger.info(
+                f"Kullanıcı ağaca yerleştirildi. "
+                f"User ID: {user_id}, Parent ID: {hedef_id}, Kol: {kol}"
             )
+            return hedef_id
+
+        raise HTTPException(
+            status_code=409,
+            detail="Yoğunluk nedeniyle yerleştirme yapılamadı, lütfen tekrar deneyin."
+        )
 
-        # Zaten yerleştirilmiş mi?
-        if user.parent_id is not None:
+    @staticmethod
+    def place_users_bulk(db: Session, sponsor_id: int, yerlesimler: List[Dict]) -> List[Dict]:
+        """
+        Sponsorun bekleyen üyelerini tek transaction'da ağaca yerleştirir.
+
+        Her kalem {"uye_id", "kol", "parent_id"} şeklindedir:
+        - parent_id + kol: Tam pozisyon (kol boş olmalı, parent sponsorun ekibinde olmalı)
+        - Sadece kol: O kolun en dışındaki boş yere taşmalı yerleşim
+        - Hiçbiri: Sponsorun daha az üyeli koluna taşmalı yerleşim
+        Kalemler sırayla planlanır; aynı kola taşan üyeler birbirinin altına dizilir.
+
+        Plan önce kilitsiz çıkarılır, sonra etkilenen tüm satırlar id sırasıyla
+        kilitlenip plan kilit altında yeniden çıkarılır; ikisi aynıysa yazılır
+        (değilse yeni planla tekrar denenir). Yazımda ekip sayaçları tek UPDATE,
+        önbellek temizliği tek seferde yapılır.
+
+        Returns:
+            Kalem başına sonuç listesi ({"uye_id", "success", "message", ...})
+        """
+        if len(yerlesimler) > TOPLU_YERLESIM_LIMITI:
             raise HTTPException(
                 status_code=400,
-                detail="Bu kullanıcı zaten ağaca yerleştirilmiş."
+                detail=f"Tek seferde en fazla {TOPLU_YERLESIM_LIMITI} üye yerleştirilebilir."
             )
 
-        # Parent kullanıcısını kontrol et
-        parent = db.query(models.Kullanici).filter(
-            models.Kullanici.id == parent_id
-        ).first()
+        plan = BinaryTreeService._toplu_yerlesim_plani(db, sponsor_id, yerlesimler)
+        for deneme in range(YERLESIM_DENEME_SAYISI):
+            sonuclar, atamalar = plan
+            if not atamalar:
+                db.rollback()
+                return sonuclar
 
-        if not parent:
-            raise HTTPException(
-                status_code=404,
-                detail="Üst kullanıcı (parent) bulunamadı."
-            )
+            uye_ids = [atama[0] for atama in atamalar]
+            BinaryTreeService._yerlesim_kilitle(db, uye_ids, [atama[1] for atama in atamalar])
 
-        # Seçilen kol dolu mu?
-        existing_in_leg = db.query(models.Kullanici).filter(
-            models.Kullanici.parent_id == parent_id,
-            models.Kullanici.kol == kol
-        ).first()
+            kilitli_plan = BinaryTreeService._toplu_yerlesim_plani(db, sponsor_id, yerlesimler)
+            if kilitli_plan == plan:
+                break
 
-        if existing_in_leg:
+            # Kilitler alınana kadar ağaç değişti; güncel planla tekrar dene
+            db.rollback()
+            plan = kilitli_plan
+        else:
             raise HTTPException(
-                status_code=400,
-                detail=f"{parent.tam_ad} kullanıcısının {kol} kolu zaten dolu!"
+                status_code=409,
+                detail="Yoğunluk nedeniyle yerleştirme yapılamadı, lütfen tekrar deneyin."
             )
 
         try:
-            # Kullanıcıyı yerleştir
-            user.parent_id = parent_id
-            user.kol = kol
+            uyeler = {
+                uye.id: uye
+                for uye in db.query(models.Kullanici).filter(models.Kullanici.id.in_(uye_ids)).all()
+            }
+            for uye_id, parent_id, kol, adet in atamalar:
+                uyeler[uye_id].parent_id = parent_id
+                uyeler[uye_id].kol = kol
+            db.flush()
+
+            # Sırayla: Aynı partide birbirinin altına yerleşenler üstündekinin yollarını kullanır
+            for uye_id, parent_id, kol, adet in atamalar:
+                BinaryTreeService._link_ancestry(db, uye_id, parent_id, kol)
+
+            BinaryTreeService._bump_leg_counters_bulk(
+                db, {uye_id: adet for uye_id, parent_id, kol, adet in atamalar}
+            )
 
             db.commit()
-            db.refresh(user)
-
-            logger.info(
-                f"Kullanıcı ağaca yerleştirildi. "
-                f"User ID: {user_id}, Parent ID: {parent_id}, Kol: {kol}"
-            )
 
         except Exception as e:
             db.rollback()
-            logger.error(f"Ağaca yerleştirme sırasında hata: {e}")
+            logger.error(f"Toplu yerleştirme sırasında hata: {e}")
             raise HTTPException(
                 status_code=500,
                 detail=f"Yerleştirme işlemi başarısız: {str(e)}"
             )
 
+        BinaryTreeService._yerlesim_onbellegini_guncelle(db, uye_ids, [sponsor_id])
+
+        logger.info(
+            f"Toplu yerleştirme tamamlandı. "
+            f"Sponsor ID: {sponsor_id}, Yerleşen: {len(atamalar)}, İstenen: {len(yerlesimler)}"
+        )
+        return sonuclar
+
+    @staticmethod
+    def _toplu_yerlesim_plani(db: Session, sponsor_id: int, yerlesimler: List[Dict]):
+        """
+        Toplu yerleşim planını çıkarır (yazmaz). Kalem sayısından bağımsız
+        sabit sayıda sorgu: üyeler, sponsor, hedef parent'lar, dolu kollar ve
+        kullanılan her kol için bir dış hat sorgusu.
+
+        Returns:
+            (sonuclar, atamalar) - atamalar: [(uye_id, parent_id, kol, adet), ...]
+        """
+        uye_ids = [kalem["uye_id"] for kalem in yerlesimler]
+        hedef_ids = list({kalem["parent_id"] for kalem in yerlesimler if kalem.get("parent_id") is not None})
+
+        sponsor = db.execute(text("""
+            SELECT sol_ekip_sayisi, sag_ekip_sayisi FROM kullanicilar WHERE id = :sponsor_id
+        """), {"sponsor_id": sponsor_id}).first()
+
+        if not sponsor:
+            raise HTTPException(
+                status_code=404,
+                detail="Sponsor kullanıcı bulunamadı!"
+            )
+
+        uyeler = {
+            uye.id: uye
+            for uye in db.execute(text("""
+                SELECT id, referans_id, parent_id, sol_ekip_sayisi, sag_ekip_sayisi
+                FROM kullanicilar
+                WHERE id = ANY(CAST(:ids AS integer[]))
+            """), {"ids": uye_ids})
+        }
+
+        # Hedef parent -> sponsorun hangi kolunda (sponsorun kendisi ayrıca ele alınır)
+        taraf = {
+            satir.alt_id: satir.kol
+            for satir in db.execute(text("""
+                SELECT alt_id, kol FROM kullanici_agac_yollari
+                WHERE ata_id = :sponsor_id AND alt_id = ANY(CAST(:ids AS integer[]))
+            """), {"sponsor_id": sponsor_id, "ids": hedef_ids})
+        }
+
+        # Hedef parent'ların veritabanında dolu olan kolları
+        dolu = {
+            (satir.parent_id, satir.kol)
+            for satir in db.execute(text("""
+                SELECT parent_id, kol FROM kullanicilar
+                WHERE parent_id = ANY(CAST(:ids AS integer[])) AND kol IS NOT NULL
+            """), {"ids": hedef_ids})
+        }
+
+        ekip = {"SOL": sponsor.sol_ekip_sayisi or 0, "SAG": sponsor.sag_ekip_sayisi or 0}
+        dis_uc: Dict[str, int] = {}     # kol -> veritabanındaki dış hat ucu
+        planlanan: Dict[tuple, int] = {}  # (parent_id, kol) -> bu partide yerleşen üye
+        yerlesenler = set()
+        sonuclar, atamalar = [], []
+
+        for kalem in yerlesimler:
+            uye_id = kalem["uye_id"]
+            kol = getattr(kalem.get("kol"), "value", kalem.get("kol"))
+            parent_id = kalem.get("parent_id")
+            uye = uyeler.get(uye_id)
+
+            hata = None
+            if uye is None or uye.referans_id != sponsor_id:
+                hata = "Bu üyeyi yerleştirme yetkiniz yok!"
+            elif uye.parent_id is not None or uye_id in yerlesenler:
+                hata = "Bu kullanıcı zaten ağaca yerleştirilmiş."
+            elif kol is not None and kol not in ("SOL", "SAG"):
+                hata = "Kol sadece 'SOL' veya 'SAG' olabilir."
+            elif parent_id is not None and kol is None:
+                hata = "Üst kullanıcı seçildiğinde kol belirtilmelidir."
+            elif parent_id is not None and parent_id != sponsor_id and parent_id not in taraf:
+                hata = "Üst kullanıcı (parent) ekibinizde bulunamadı."
+            elif parent_id is not None and ((parent_id, kol) in dolu or (parent_id, kol) in planlanan):
+                hata = f"Seçilen {kol} kolu zaten dolu!"
+
+            if hata:
+                sonuclar.append({"uye_id": uye_id, "success": False, "message": hata})
+                continue
+
+            if parent_id is not None:
+                sponsor_kolu = kol if parent_id == sponsor_id else taraf[parent_id]
+            else:
+                if kol is None:
+                    # Otomatik: Daha az üyeli kol
+                    kol = "SOL" if ekip["SOL"] <= ekip["SAG"] else "SAG"
+                sponsor_kolu = kol
+
+                if kol not in dis_uc:
+                    dis_uc[kol] = BinaryTreeService.find_empty_spot(db, sponsor_id, kol)
+                # Bu partide dış hatta eklenenlerin altına in
+                parent_id = dis_uc[kol]
+                while (parent_id, kol) in planlanan:
+                    parent_id = planlanan[(parent_id, kol)]
+
+            adet = 1 + (uye.sol_ekip_sayisi or 0) + (uye.sag_ekip_sayisi or 0)
+            planlanan[(parent_id, kol)] = uye_id
+            yerlesenler.add(uye_id)
+            ekip[sponsor_kolu] += adet
+            atamalar.append((uye_id, parent_id, kol, adet))
+            sonuclar.append({
+                "uye_id": uye_id,
+                "success": True,
+                "parent_id": parent_id,
+                "kol": kol,
+                "message": "Üye başarıyla yerleştirildi."
+            })
+
+        return sonuclar, atamalar
+
+    @staticmethod
+    def _yerlesim_kilitle(db: Session, user_ids: List[int], parent_ids: List[int]) -> set:
+        """
+        Yerleşimin değiştireceği satırları tek sorguda, id sırasıyla kilitler:
+        yerleşen kullanıcılar, parent'lar ve parent'ların tüm ataları (ekip sayaçları).
+
+        Returns:
+            Kilitlenen (var olan) kullanıcı id'leri
+        """
+        satirlar = db.execute(text("""
+            SELECT id FROM kullanicilar
+            WHERE id = ANY(CAST(:ids AS integer[]))
+               OR id IN (
+                   SELECT ata_id FROM kullanici_agac_yollari
+                   WHERE alt_id = ANY(CAST(:parent_ids AS integer[]))
+               )
+            ORDER BY id
+            FOR UPDATE
+        """), {"ids": list(user_ids) + list(parent_ids), "parent_ids": list(parent_ids)}).fetchall()
+
+        return {satir.id for satir in satirlar}
+
+    @staticmethod
+    def _yerlesim_onbellegini_guncelle(db: Session, user_ids: List[int], sponsor_ids) -> None:
+        """
+        Yerleştirme commit'inden sonra etkilenen önbellekleri günceller:
+        - Ağaç: Sadece AGAC_CACHE_DERINLIGI (+1) mesafedeki atalar
+        - Dashboard: Ekip sayacı değişen tüm atalar silinir (derinlikle büyür),
+          bekleyen sayısı değişen sponsorların özeti yeniden yazılır (write-through)
+
+        Toplu yerleşimde tüm kullanıcılar için tek ata sorgusu ve tek DEL yapılır.
+        Yerleşim commit edilmiş olduğundan hatalar loglanır, yukarı fırlatılmaz.
+        """
+        try:
+            atalar = db.query(
+                models.KullaniciAgacYolu.ata_id,
+                models.KullaniciAgacYolu.derinlik
+            ).filter(models.KullaniciAgacYolu.alt_id.in_(user_ids)).all()
+
+            BinaryTreeService.invalidate_tree_cache_for(
+                list(user_ids) + [ata.ata_id for ata in atalar if ata.derinlik <= AGAC_CACHE_DERINLIGI + 1]
+            )
+            crud.invalidate_dashboard_summaries({ata.ata_id for ata in atalar})
+            sponsor_ids = [sponsor_id for sponsor_id in set(sponsor_ids) if sponsor_id]
+            if sponsor_ids:
+                crud.refresh_dashboard_summaries(db, sponsor_ids)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Yerleştirme sonrası önbellek güncellenemedi. User ID'ler: {list(user_ids)}: {e}")
+
+    @staticmethod
+    def invalidate_tree_cache(db: Session, user_id: int) -> None:
+        """
+        Kullanıcının düğümünü (veya alt ağacını) gösteren önbellekteki ağaçları
+        siler: AGAC_CACHE_DERINLIGI (+1 genişletme düğümü) mesafedeki atalar +
+        kullanıcının kendisi.
+
+        Ata listesi closure table'dan tek sorguda gelir; silme tek DEL komutudur
+        (tüm ağaç önbelleğini silen KEYS taraması yerine).
+        """
+        # +1: Sınırın bir altındaki düğümler de "Daha Fazla..." olarak önbellekte
+        atalar = db.query(models.KullaniciAgacYolu.ata_id).filter(
+            models.KullaniciAgacYolu.alt_id == user_id,
+            models.KullaniciAgacYolu.derinlik <= AGAC_CACHE_DERINLIGI + 1
+        ).all()
+
+        BinaryTreeService.invalidate_tree_cache_for(
+            [user_id] + [ata.ata_id for ata in atalar]
+        )
+
+    @staticmethod
+    def invalidate_tree_cache_for(user_ids) -> None:
+        """Verilen kullanıcıların önbellekteki ağaçlarını tek DEL ile siler."""
+        keys = {agac_cache_key(user_id) for user_id in user_ids}
+        if keys:
+            cache_delete(*keys)
+
     @staticmethod
     def find_empty_spot(
         db: Session,
@@ -196,7 +545,8 @@ class BinaryTreeService:
         Belirli bir kolda boş yer bulur. Eğer kol doluysa, o koldaki
         en dıştaki (leaf) pozisyona kadar iner.
 
-        Bu recursive işlemi while döngüsü ile yapar (stack overflow önlemi).
+        Dış hat tek bir recursive CTE ile yürünür; kol derinliğinden bağımsız
+        olarak tek sorgu (eski yöntem: seviye başına bir sorgu).
 
         Args:
             db: Database session
@@ -206,93 +556,235 @@ class BinaryTreeService:
         Returns:
             Boş pozisyonun parent ID'si
         """
-        current_parent_id = parent_id
-        iteration_limit = 1000  # Sonsuz döngü koruması
+        kol = getattr(preferred_leg, "value", preferred_leg)
 
-        while iteration_limit > 0:
-            iteration_limit -= 1
+        en_dis = db.execute(text("""
+            WITH RECURSIVE dis_hat (id, derinlik) AS (
+                -- Anchor: Başlangıç parent
+                SELECT CAST(:parent_id AS integer), 0
 
-            # Bu parent'ın seçilen kolunda biri var mı?
-            child_in_leg = db.query(models.Kullanici).filter(
-                models.Kullanici.parent_id == current_parent_id,
-                models.Kullanici.kol == preferred_leg
-            ).first()
+                UNION ALL
 
-            if not child_in_leg:
-                # Kol boş - burası yerleştirme için uygun
-                return current_parent_id
+                -- Recursive: Aynı koldaki çocuğa in
+                SELECT k.id, dh.derinlik + 1
+                FROM kullanicilar k
+                INNER JOIN dis_hat dh ON k.parent_id = dh.id
+                WHERE k.kol = :kol AND dh.derinlik < :limit
+            )
+            SELECT id, derinlik FROM dis_hat ORDER BY derinlik DESC LIMIT 1
+        """), {"parent_id": parent_id, "kol": kol, "limit": MAX_DIS_HAT_DERINLIGI}).first()
+
+        if en_dis.derinlik >= MAX_DIS_HAT_DERINLIGI:
+            # Güvenlik önlemi - bozuk (döngülü) ağaç
+            logger.warning(
+                f"Boş yer bulma işlemi derinlik limitine ulaştı. "
+                f"Parent ID: {parent_id}, Kol: {kol}"
+            )
 
-            # Kol dolu - bir seviye aşağı in
-            current_parent_id = child_in_leg.id
+        return en_dis.id
 
-        # Güvenlik önlemi - çok derin bir ağaç
-        logger.warning(
-            f"Boş yer bulma işlemi iterasyon limitine ulaştı. "
-            f"Parent ID: {parent_id}, Kol: {preferred_leg}"
-        )
-        return current_parent_id
+    @staticmethod
+    def _link_ancestry(db: Session, user_id: int, parent_id: int, kol: str) -> None:
+        """
+        Yeni yerleşimi closure table'a (kullanici_agac_yollari) işler.
+
+        Parent'ın tüm ataları (ve parent'ın kendisi) ile yerleşen kullanıcının
+        kendisi ve varsa mevcut alt ağacı arasındaki tüm ata-torun çiftlerini
+        tek INSERT ... SELECT ile ekler. Commit çağıran tarafa aittir.
+        """
+        db.execute(text("""
+            INSERT INTO kullanici_agac_yollari (ata_id, alt_id, derinlik, kol)
+            SELECT ust.ata_id, alt.alt_id, ust.derinlik + alt.derinlik + 1, ust.kol
+            FROM (
+                -- Parent'ın ataları + parent'ın kendisi
+                SELECT ata_id, derinlik, kol
+                FROM kullanici_agac_yollari
+                WHERE alt_id = :parent_id
+
+                UNION ALL
+
+                SELECT :parent_id, 0, :kol
+            ) ust
+            CROSS JOIN (
+                -- Yerleşen kullanıcı + (varsa) mevcut alt ağacı
+                SELECT alt_id, derinlik
+                FROM kullanici_agac_yollari
+                WHERE ata_id = :user_id
+
+                UNION ALL
+
+                SELECT :user_id, 0
+            ) alt
+        """), {"user_id": user_id, "parent_id": parent_id, "kol": kol})
 
     @staticmethod
-    def get_team_count(db: Session, user_id: int, kol: Optional[str] = None) -> int:
+    def _bump_leg_counters(db: Session, user_id: int, adet: int) -> None:
         """
-        Kullanıcının altındaki toplam ekip sayısını hesaplar.
+        Yerleşen kullanıcının tüm atalarının sol_ekip_sayisi / sag_ekip_sayisi
+        sayaçlarını tek UPDATE ile artırır. _link_ancestry'den sonra çağrılmalıdır.
 
-        Recursive CTE kullanarak tüm alt ağacı sayar.
+        Args:
+            adet: Eklenen üye sayısı (kullanıcı + varsa mevcut alt ağacı)
+        """
+        db.execute(text("""
+            UPDATE kullanicilar k
+            SET sol_ekip_sayisi = COALESCE(k.sol_ekip_sayisi, 0)
+                    + CASE WHEN y.kol = 'SOL' THEN :adet ELSE 0 END,
+                sag_ekip_sayisi = COALESCE(k.sag_ekip_sayisi, 0)
+                    + CASE WHEN y.kol = 'SAG' THEN :adet ELSE 0 END
+            FROM kullanici_agac_yollari y
+            WHERE y.alt_id = :user_id AND y.ata_id = k.id
+        """), {"user_id": user_id, "adet": adet})
+
+    @staticmethod
+    def _bump_leg_counters_bulk(db: Session, adetler: Dict[int, int]) -> None:
+        """
+        Toplu yerleşimde tüm ataların ekip sayaçlarını tek UPDATE ile artırır.
+        Tüm kullanıcılar için _link_ancestry'den sonra çağrılmalıdır.
 
         Args:
-            db: Database session
-            user_id: Kullanıcı ID
-            kol: Belirli bir kolu saymak için (None ise tüm ağaç)
+            adetler: {yerleşen kullanıcı ID: eklenen üye sayısı (kendisi + mevcut alt ağacı)}
+        """
+        db.execute(text("""
+            UPDATE kullanicilar k
+            SET sol_ekip_sayisi = COALESCE(k.sol_ekip_sayisi, 0) + f.sol,
+                sag_ekip_sayisi = COALESCE(k.sag_ekip_sayisi, 0) + f.sag
+            FROM (
+                SELECT y.ata_id,
+                       SUM(CASE WHEN y.kol = 'SOL' THEN a.adet ELSE 0 END) AS sol,
+                       SUM(CASE WHEN y.kol = 'SAG' THEN a.adet ELSE 0 END) AS sag
+                FROM kullanici_agac_yollari y
+                INNER JOIN unnest(CAST(:user_ids AS integer[]), CAST(:adetler AS integer[])) AS a(user_id, adet)
+                    ON y.alt_id = a.user_id
+                GROUP BY y.ata_id
+            ) f
+            WHERE k.id = f.ata_id
+        """), {"user_ids": list(adetler.keys()), "adetler": list(adetler.values())})
+
+    @staticmethod
+    def rebuild_leg_counters(db: Session) -> None:
+        """
+        Tüm kullanıcıların sol/sağ ekip sayaçlarını ata-torun indeksinden
+        yeniden hesaplar. Tek seferlik backfill / onarım işlemidir.
+        """
+        try:
+            db.execute(text("UPDATE kullanicilar SET sol_ekip_sayisi = 0, sag_ekip_sayisi = 0"))
+            db.execute(text("""
+                UPDATE kullanicilar k
+                SET sol_ekip_sayisi = s.sol,
+                    sag_ekip_sayisi = s.sag
+                FROM (
+                    SELECT ata_id,
+                           COUNT(*) FILTER (WHERE kol = 'SOL') AS sol,
+                           COUNT(*) FILTER (WHERE kol = 'SAG') AS sag
+                    FROM kullanici_agac_yollari
+                    GROUP BY ata_id
+                ) s
+                WHERE s.ata_id = k.id
+            """))
+            db.commit()
+            logger.info("Ekip sayaçları yeniden hesaplandı.")
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Ekip sayaçları hesaplanırken hata: {e}")
+            raise
+
+    @staticmethod
+    def rebuild_ancestry_index(db: Session) -> int:
+        """
+        Closure table'ı kullanicilar.parent_id üzerinden sıfırdan oluşturur.
+        Mevcut veritabanları için tek seferlik backfill / onarım işlemidir.
 
         Returns:
-            Ekip üyesi sayısı
+            Oluşturulan ata-torun satırı sayısı
         """
-        if kol:
-            # Belirli bir kol için
-            cte_query = text("""
-                WITH RECURSIVE team_count (id) AS (
-                    -- Anchor: Seçilen koldaki direkt alt üye
-                    SELECT id
+        try:
+            db.execute(text("DELETE FROM kullanici_agac_yollari"))
+            result = db.execute(text("""
+                INSERT INTO kullanici_agac_yollari (ata_id, alt_id, derinlik, kol)
+                WITH RECURSIVE yollar (ata_id, alt_id, derinlik, kol) AS (
+                    -- Anchor: Doğrudan parent ilişkileri
+                    SELECT parent_id, id, 1, kol
                     FROM kullanicilar
-                    WHERE parent_id = :user_id AND kol = :kol
+                    WHERE parent_id IS NOT NULL
 
                     UNION ALL
 
-                    -- Recursive: Tüm alt üyeleri bul
-                    SELECT k.id
-                    FROM kullanicilar k
-                    INNER JOIN team_count tc ON k.parent_id = tc.id
+                    -- Recursive: Bir üst ataya çık (kol, atanın çocuğunun kolu olur)
+                    SELECT k.parent_id, y.alt_id, y.derinlik + 1, k.kol
+                    FROM yollar y
+                    INNER JOIN kullanicilar k ON k.id = y.ata_id
+                    WHERE k.parent_id IS NOT NULL
                 )
-                SELECT COUNT(id) as toplam FROM team_count;
-            """)
+                SELECT ata_id, alt_id, derinlik, kol FROM yollar
+            """))
+            db.commit()
+            logger.info(f"Ata-torun indeksi yeniden oluşturuldu. Satır sayısı: {result.rowcount}")
+            return result.rowcount
 
-            result = db.execute(cte_query, {
-                "user_id": user_id,
-                "kol": kol
-            }).fetchone()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Ata-torun indeksi oluşturulurken hata: {e}")
+            raise
 
-        else:
-            # Tüm ağaç
-            cte_query = text("""
-                WITH RECURSIVE team_count (id) AS (
-                    -- Anchor: Direkt alt üyeler
-                    SELECT id
-                    FROM kullanicilar
-                    WHERE parent_id = :user_id
+    @staticmethod
+    def is_in_downline(db: Session, ata_id: int, alt_id: int) -> bool:
+        """
+        alt_id kullanıcısının ata_id kullanıcısının binary ağacında (herhangi
+        bir derinlikte) olup olmadığını kontrol eder. Tek primary key lookup.
+        """
+        if ata_id == alt_id:
+            return True
 
-                    UNION ALL
+        return db.query(models.KullaniciAgacYolu).filter(
+            models.KullaniciAgacYolu.ata_id == ata_id,
+            models.KullaniciAgacYolu.alt_id == alt_id
+        ).first() is not None
 
-                    -- Recursive: Tüm alt üyeleri bul
-                    SELECT k.id
-                    FROM kullanicilar k
-                    INNER JOIN team_count tc ON k.parent_id = tc.id
-                )
-                SELECT COUNT(id) as toplam FROM team_count;
-            """)
+    @staticmethod
+    def get_team_count(db: Session, user_id: int, kol: Optional[str] = None) -> int:
+        """
+        Kullanıcının altındaki toplam ekip sayısını hesaplar.
+
+        Ata-torun indeksi (kullanici_agac_yollari) üzerinde tek indeksli
+        COUNT sorgusu kullanır; alt ağacı dolaşmaz.
+
+        Args:
+            db: Database session
+            user_id: Kullanıcı ID
+            kol: Belirli bir kolu saymak için (None ise tüm ağaç)
+
+        Returns:
+            Ekip üyesi sayısı
+        """
+        sorgu = db.query(models.KullaniciAgacYolu).filter(
+            models.KullaniciAgacYolu.ata_id == user_id
+        )
+        if kol:
+            sorgu = sorgu.filter(models.KullaniciAgacYolu.kol == kol)
 
-            result = db.execute(cte_query, {"user_id": user_id}).fetchone()
+        return sorgu.count()
 
-        return result.toplam if result else 0
+    @staticmethod
+    def get_team_counts_by_leg(db: Session, user_id: int) -> Dict[str, int]:
+        """
+        Sol ve sağ kol ekip sayılarını tek GROUP BY sorgusu ile getirir.
+
+        Returns:
+            {"SOL": int, "SAG": int}
+        """
+        result = db.execute(text("""
+            SELECT kol, COUNT(*) AS uye_sayisi
+            FROM kullanici_agac_yollari
+            WHERE ata_id = :user_id
+            GROUP BY kol
+        """), {"user_id": user_id}).fetchall()
+
+        sayilar = {"SOL": 0, "SAG": 0}
+        for row in result:
+            sayilar[row.kol] = row.uye_sayisi
+        return sayilar
 
     @staticmethod
     def get_pending_placements(db: Session, sponsor_id: int) -> List[models.Kullanici]:
@@ -1,23 +1,88 @@
 """
 Commission Service - Komisyon, nesil geliri ve eşleme ödemelerini yönetir.
+
+İki çalışma modu vardır:
+- Varsayılan: Her ödeme anında bakiyeye yazılır ve commit edilir (tekil çağrılar için)
+- Defter (KomisyonDefteri) modu: Bir ödeme akışındaki tüm bakiye farkları ve cüzdan
+  hareketleri bellekte biriktirilir, akış sonunda tek toplu INSERT ve tek toplu
+  UPDATE ile yazılır. Commit çağıran tarafa aittir (tek transaction, tek commit).
 """
 from sqlalchemy.orm import Session
+from sqlalchemy import text, insert
 from fastapi import HTTPException
 import logging
-from typing import Optional
+from typing import Optional, Dict, List
 from decimal import Decimal
 
-from app import models
+from app import models, settings_cache
 from app.crud import create_wallet_transaction
+from app.services.earnings_service import EarningsService
 
 logger = logging.getLogger(__name__)
 
 
+class KomisyonDefteri:
+    """
+    Bir ödeme akışı boyunca oluşan bakiye farklarını ve cüzdan hareketlerini
+    bellekte toplar; flush() ile tek seferde veritabanına yazar.
+    """
+
+    def __init__(self):
+        self.bakiye_farklari: Dict[int, Decimal] = {}
+        self.hareketler: List[Dict] = []
+
+    def ekle(self, user_id: int, miktar, islem_tipi: str, aciklama: str, kaynak_user_id: Optional[int] = None) -> None:
+        """Bakiye farkını ve ilgili cüzdan hareketini deftere ekler."""
+        miktar = Decimal(str(miktar))
+        self.bakiye_farklari[user_id] = self.bakiye_farklari.get(user_id, Decimal("0")) + miktar
+        self.hareketler.append({
+            "user_id": user_id,
+            "miktar": miktar,
+            "islem_tipi": islem_tipi,
+            "aciklama": aciklama,
+            "kaynak_user_id": kaynak_user_id
+        })
+
+    def flush(self, db: Session) -> None:
+        """
+        Biriken hareketleri tek toplu INSERT (+ aylık özet upsert'ü), bakiye
+        farklarını tek toplu UPDATE ile yazar. Commit yapmaz.
+        """
+        if self.hareketler:
+            # Tüm hareketler aynı zaman damgasıyla yazılır; aylık özet aynı ayı kullanır
+            simdi = models.get_turkey_time()
+            for hareket in self.hareketler:
+                hareket["tarih"] = simdi
+            db.execute(insert(models.CuzdanHareket), self.hareketler)
+
+            EarningsService.kaydet(db, (
+                (h["user_id"], h["islem_tipi"], h["miktar"], simdi) for h in self.hareketler
+            ))
+
+        if self.bakiye_farklari:
+            db.execute(text("""
+                UPDATE kullanicilar k
+                SET toplam_cv = COALESCE(k.toplam_cv, 0) + f.miktar
+                FROM unnest(CAST(:user_ids AS integer[]), CAST(:miktarlar AS numeric[])) AS f(user_id, miktar)
+                WHERE k.id = f.user_id
+            """), {
+                "user_ids": list(self.bakiye_farklari.keys()),
+                "miktarlar": list(self.bakiye_farklari.values())
+            })
+
+        logger.info(
+            f"Komisyon defteri yazıldı. Hareket: {len(self.hareketler)}, "
+            f"Kullanıcı: {len(self.bakiye_farklari)}"
+        )
+        self.bakiye_farklari = {}
+        self.hareketler = []
+
+
 class CommissionService:
     """Komisyon ve ödeme dağıtım servisi"""
-    
+
     @staticmethod
-    def check_matching(db: Session, kullanici_id: int) -> None:
+    def check_matching(db: Session, kullanici_id: int, defter: Optional[KomisyonDefteri] = None) -> None:
         """
         Kullanıcının kısa kol cirosuna göre eşleşme ödemesi yapar.
         %13 kısa kol mantığı uygulanır.
@@ -36,32 +101,53 @@ class CommissionService:
             if not kullanici:
                 return
 
-            # PV değerleri None ise 0 olarak başlat
-            if kullanici.sol_pv is None:
-                kullanici.sol_pv = 0
-            if kullanici.sag_pv is None:
-                kullanici.sag_pv = 0
+            CommissionService.apply_matching(db, kullanici, defter)
+
+        except Exception as e:
+            logger.error(f"Eşleme kontrolü sırasında hata: {e}")
+            db.rollback()
+            raise
+
+    @staticmethod
+    def apply_matching(db: Session, kullanici: models.Kullanici, defter: Optional[KomisyonDefteri] = None) -> None:
+        """
+        Önceden yüklenmiş (ve kilitlenmiş) kullanıcı satırı üzerinde eşleşme
+        ödemesini uygular. Satırı tekrar sorgulamaz; toplu PV dağıtımında
+        bellekteki upline satırlarıyla çağrılır.
+        """
+        # PV değerleri None ise 0 olarak başlat
+        if kullanici.sol_pv is None:
+            kullanici.sol_pv = 0
+        if kullanici.sag_pv is None:
+            kullanici.sag_pv = 0
+
+        # Her iki kolda da puan birikmiş mi?
+        if kullanici.sol_pv > 0 and kullanici.sag_pv > 0:
+            # Kısa kolu (ödenecek puanı) belirle
+            odenecek_puan = min(kullanici.sol_pv, kullanici.sag_pv)
 
-            # Her iki kolda da puan birikmiş mi?
-            if kullanici.sol_pv > 0 and kullanici.sag_pv > 0:
-                # Kısa kolu (ödenecek puanı) belirle
-                odenecek_puan = min(kullanici.sol_pv, kullanici.sag_pv)
+            if odenecek_puan <= 0:
+                return
 
-                if odenecek_puan <= 0:
-                    return
+            # Ayarlardan %13 oranını çek (admin panelinden güncellenebilir)
+            odeme_orani = CommissionService._get_setting(db, "kisa_kol_oran", 0.13)
 
-                # Ayarlardan %13 oranını çek (admin panelinden güncellenebilir)
-                odeme_orani = CommissionService._get_setting(db, "kisa_kol_oran", 0.13)
+            # Kazanç = Kısa Kol Cirosu * Oran
+            kazanc = odenecek_puan * odeme_orani
+            aciklama = f"Kısa kol cirosu ({odenecek_puan} PV) üzerinden %{int(odeme_orani*100)} kazanç."
 
-                # Kazanç = Kısa Kol Cirosu * Oran
-                kazanc = odenecek_puan * odeme_orani
+            # Puanları kollardan düş (Dengeleme)
+            kullanici.sol_pv -= odenecek_puan
+            kullanici.sag_pv -= odenecek_puan
 
-                # Bakiyeyi güncelle ve puanları kollardan düş (Dengeleme)
+            if defter is not None:
+                # Bakiye ve cüzdan hareketi akış sonunda toplu yazılacak
+                defter.ekle(kullanici.id, kazanc, "ESLESME", aciklama)
+            else:
+                # Bakiyeyi güncelle
                 if kullanici.toplam_cv is None:
                     kullanici.toplam_cv = Decimal("0")
                 kullanici.toplam_cv += Decimal(str(kazanc))
-                kullanici.sol_pv -= odenecek_puan
-                kullanici.sag_pv -= odenecek_puan
 
                 db.commit()
 
@@ -69,100 +155,137 @@ class CommissionService:
                 create_wallet_transaction(
                     db,
                     models.CuzdanHareket(
-                        user_id=kullanici_id,
+                        user_id=kullanici.id,
                         miktar=kazanc,
                         islem_tipi="ESLESME",
-                        aciklama=f"Kısa kol cirosu ({odenecek_puan} PV) üzerinden %{int(odeme_orani*100)} kazanç."
+                        aciklama=aciklama
                     )
                 )
 
-                # Nesil Geliri (Matching) Dağıtımı
-                CommissionService.distribute(db, kullanici.id, kazanc)
+            # Nesil Geliri (Matching) Dağıtımı
+            CommissionService.distribute(db, kullanici.id, kazanc, defter)
 
-        except Exception as e:
-            logger.error(f"Eşleme kontrolü sırasında hata: {e}")
-            db.rollback()
-            raise
+    @staticmethod
+    def get_generation_rates(db: Session) -> List[Decimal]:
+        """
+        Nesil oranlarını (1. nesilden başlayarak kesintisiz) döndürür.
+
+        Tablo süreç içi ayar önbelleğinde tutulur; /admin/mlm/nesil/guncelle
+        kaydında invalidate_generation_rates() ile tüm worker'larda temizlenir.
+        """
+        def _yukle():
+            ayarlar = db.query(models.NesilAyari.nesil_no, models.NesilAyari.oran).all()
+            oran_map = {ayar.nesil_no: ayar.oran for ayar in ayarlar}
+
+            # Eski davranış: İlk eksik nesilde dağıtım durur
+            oranlar = []
+            nesil = 1
+            while nesil in oran_map:
+                oranlar.append(oran_map[nesil])
+                nesil += 1
+            return oranlar
+
+        return settings_cache.get_or_load(settings_cache.NESIL_ORANLARI, _yukle)
+
+    @staticmethod
+    def invalidate_generation_rates() -> None:
+        """Nesil oranları önbelleğini temizler (admin kaydından sonra çağrılır)."""
+        settings_cache.invalidate(settings_cache.NESIL_ORANLARI)
 
     @staticmethod
-    def distribute(db: Session, alt_uye_id: int, kazanilan_miktar: float) -> None:
+    def distribute(db: Session, alt_uye_id: int, kazanilan_miktar: float, defter: Optional[KomisyonDefteri] = None) -> None:
         """
         Sponsor hattı boyunca yukarı çıkar ve her nesle tanımlı oranını öder.
-        Recursive yerine while döngüsü kullanır.
+
+        Nesil oranları önbellekten okunur, sponsor (referans_id) zinciri tek
+        recursive sorguda getirilir; derinlikten bağımsız sabit sayıda sorgu.
+        Defter verilmezse ödemeler yerel bir defterle yazılıp commit edilir.
         """
         # Max derinlik
         MAX_NESIL = 10
 
-        current_alt_uye_id = alt_uye_id
-
-        for nesil in range(1, MAX_NESIL + 1):
-            # 1. Bu nesil için bir ayar var mı?
-            ayar = db.query(models.NesilAyari).filter(
-                models.NesilAyari.nesil_no == nesil
-            ).first()
-            if not ayar:
-                break  # Ayar yoksa veya bittiyse dur.
-
-            # 2. Alt üyenin sponsorunu (liderini) bul
-            alt_uye = db.query(models.Kullanici).filter(
-                models.Kullanici.id == current_alt_uye_id
-            ).first()
-            if not alt_uye or not alt_uye.referans_id:
-                break  # Sponsor zinciri koptu.
-
-            lider = db.query(models.Kullanici).filter(
-                models.Kullanici.id == alt_uye.referans_id
-            ).first()
-            if not lider:
-                break
+        oranlar = CommissionService.get_generation_rates(db)[:MAX_NESIL]
+        if not oranlar:
+            return  # Ayar yoksa dağıtım yapılmaz.
 
-            # Bonusu öde
-            bonus = kazanilan_miktar * ayar.oran
-            lider.toplam_cv = (lider.toplam_cv or Decimal("0")) + Decimal(str(bonus))
-            db.commit()
+        # Alt üye + sponsor zinciri (nesil 0 = alt üyenin kendisi)
+        zincir = db.execute(text("""
+            WITH RECURSIVE sponsor_zinciri (id, tam_ad, referans_id, nesil) AS (
+                -- Anchor: Kazancı elde eden alt üye
+                SELECT id, tam_ad, referans_id, 0
+                FROM kullanicilar
+                WHERE id = :alt_uye_id
 
-            # Cüzdan hareketi logla
-            create_wallet_transaction(
-                db,
-                models.CuzdanHareket(
-                    user_id=lider.id,
-                    miktar=bonus,
-                    islem_tipi="LIDERLIK",
-                    aciklama=f"{nesil}. Nesil Primi ({alt_uye.tam_ad} kazancından)"
-                )
+                UNION ALL
+
+                -- Recursive: Bir üst sponsora çık
+                SELECT k.id, k.tam_ad, k.referans_id, sz.nesil + 1
+                FROM kullanicilar k
+                INNER JOIN sponsor_zinciri sz ON k.id = sz.referans_id
+                WHERE sz.nesil < :max_nesil
             )
+            SELECT id, tam_ad, nesil FROM sponsor_zinciri ORDER BY nesil
+        """), {"alt_uye_id": alt_uye_id, "max_nesil": len(oranlar)}).fetchall()
+
+        aktif_defter = defter if defter is not None else KomisyonDefteri()
 
-            # Bir sonraki tur için yukarı çık
-            current_alt_uye_id = lider.id
+        # zincir[nesil] = lider, zincir[nesil - 1] = kazancı elde eden alt üye
+        for nesil in range(1, len(zincir)):
+            alt_uye = zincir[nesil - 1]
+            lider = zincir[nesil]
+
+            # Bonusu öde
+            bonus = Decimal(str(kazanilan_miktar)) * oranlar[nesil - 1]
+            aktif_defter.ekle(
+                lider.id, bonus, "LIDERLIK",
+                f"{nesil}. Nesil Primi ({alt_uye.tam_ad} kazancından)"
+            )
+
+        if defter is None:
+            aktif_defter.flush(db)
+            db.commit()
 
         logger.info(f"Nesil geliri dağıtımı tamamlandı. Alt Üye ID: {alt_uye_id}, Kazanç: {kazanilan_miktar}")
 
     @staticmethod
-    def pay_referral_bonus(db: Session, sponsor_id: int, prim_miktari: float, yeni_uye_adi: str) -> None:
-        """Referans bonusu öder."""
+    def pay_referral_bonus(
+        db: Session,
+        sponsor_id: int,
+        prim_miktari: float,
+        yeni_uye_adi: str,
+        defter: Optional[KomisyonDefteri] = None,
+        yeni_uye_id: Optional[int] = None
+    ) -> None:
+        """Referans bonusu öder. Yeni üyenin id'si hareketin kaynak_user_id'sine yazılır."""
+        aciklama = f"Yeni kayıt: {yeni_uye_adi}"
+
+        if defter is not None:
+            # Sponsor varlığı çağıran tarafta doğrulanmış olmalı
+            defter.ekle(sponsor_id, prim_miktari, "REFERANS", aciklama, kaynak_user_id=yeni_uye_id)
+            logger.info(f"Referans bonusu deftere eklendi. Sponsor ID: {sponsor_id}, Miktar: {prim_miktari}")
+            return
+
         sponsor = db.query(models.Kullanici).filter(models.Kullanici.id == sponsor_id).first()
         if sponsor:
             sponsor.toplam_cv += Decimal(str(prim_miktari))
             db.commit()
-            
+
             create_wallet_transaction(
                 db,
                 models.CuzdanHareket(
                     user_id=sponsor_id,
                     miktar=prim_miktari,
                     islem_tipi="REFERANS",
-                    aciklama=f"Yeni kayıt: {yeni_uye_adi}"
+                    aciklama=aciklama,
+                    kaynak_user_id=yeni_uye_id
                 )
             )
             logger.info(f"Referans bonusu ödendi. Sponsor ID: {sponsor_id}, Miktar: {prim_miktari}")
 
     @staticmethod
     def _get_setting(db: Session, anahtar: str, varsayilan: float) -> float:
-        """Ayarları getirir, yoksa oluşturur."""
-        db_ayar = db.query(models.Ayarlar).filter(models.Ayarlar.anahtar == anahtar).first()
-        if not db_ayar:
-            yeni_ayar = models.Ayarlar(anahtar=anahtar, deger=varsayilan)
-            db.add(yeni_ayar)
-            db.commit()
-            return varsayilan
-        return db_ayar.deger
\ No newline at end of file
+        """
+        Ayarları önbellekten getirir, yoksa oluşturur.
+        Commit etmez; kayıt çağıran tarafın transaction'ı ile birlikte yazılır.
+        """
+        return settings_cache.get_ayar_or_create(db, anahtar, varsayilan)
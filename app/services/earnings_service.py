@@ -0,0 +1,159 @@
+"""
+Earnings Service - Aylık kazanç özetlerini (aylik_kazanclar) yönetir.
+
+Cüzdan hareketleri yazılırken aynı transaction içinde kullanıcı / ay / işlem
+tipi bazında toplam ve adet artımlı olarak güncellenir. Prim sayfaları
+(prim-bilgileri, referans-bonusu, anlik-eslesme) toplamları bu tablodan primary
+key aralığıyla okur; ay detayı sadece o ayın hareketleri için indeks aralığıyla okunur.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+from zoneinfo import ZoneInfo
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+
+class EarningsService:
+    """Aylık kazanç özeti servisi"""
+
+    @staticmethod
+    def kaydet(db: Session, hareketler: Iterable[Tuple[int, str, object, object]]) -> None:
+        """
+        (user_id, islem_tipi, miktar, tarih) hareketlerini aylık özete ekler.
+
+        Hareketler (kullanıcı, yıl, ay, tip) bazında bellekte toplanır ve tek
+        INSERT ... ON CONFLICT ile yazılır. Satırlar sabit sırada yazıldığı için
+        eşzamanlı akışlar birbirini kilitlemez (deadlock önlemi). Commit yapmaz.
+        """
+        ozet: Dict[Tuple[int, int, int, str], list] = {}
+        for user_id, islem_tipi, miktar, tarih in hareketler:
+            if tarih is None:
+                tarih = models.get_turkey_time()
+            anahtar = (user_id, tarih.year, tarih.month, islem_tipi)
+            satir = ozet.setdefault(anahtar, [Decimal("0"), 0])
+            satir[0] += Decimal(str(miktar or 0))
+            satir[1] += 1
+
+        if not ozet:
+            return
+
+        anahtarlar = sorted(ozet)
+        db.execute(text("""
+            INSERT INTO aylik_kazanclar (user_id, yil, ay, islem_tipi, toplam, adet)
+            SELECT * FROM unnest(
+                CAST(:user_ids AS integer[]),
+                CAST(:yillar AS integer[]),
+                CAST(:aylar AS integer[]),
+                CAST(:tipler AS varchar[]),
+                CAST(:toplamlar AS numeric[]),
+                CAST(:adetler AS integer[])
+            )
+            ON CONFLICT (user_id, yil, ay, islem_tipi) DO UPDATE
+            SET toplam = aylik_kazanclar.toplam + EXCLUDED.toplam,
+                adet = aylik_kazanclar.adet + EXCLUDED.adet
+        """), {
+            "user_ids": [a[0] for a in anahtarlar],
+            "yillar": [a[1] for a in anahtarlar],
+            "aylar": [a[2] for a in anahtarlar],
+            "tipler": [a[3] for a in anahtarlar],
+            "toplamlar": [ozet[a][0] for a in anahtarlar],
+            "adetler": [ozet[a][1] for a in anahtarlar]
+        })
+
+    @staticmethod
+    def get_monthly_totals(db: Session, user_id: int, yil: int, ay: int) -> Dict[str, Dict]:
+        """
+        Kullanıcının seçilen aydaki işlem tipi bazında kazançlarını döndürür.
+
+        Returns:
+            {"REFERANS": {"toplam": Decimal, "adet": int}, ...}
+        """
+        satirlar = db.query(models.AylikKazanc).filter(
+            models.AylikKazanc.user_id == user_id,
+            models.AylikKazanc.yil == yil,
+            models.AylikKazanc.ay == ay
+        ).all()
+
+        return {
+            satir.islem_tipi: {"toplam": satir.toplam or Decimal("0"), "adet": satir.adet}
+            for satir in satirlar
+        }
+
+    @staticmethod
+    def get_monthly_transactions(db: Session, user_id: int, yil: int, ay: int, islem_tipi: str) -> List[Dict]:
+        """
+        Kullanıcının seçilen aydaki verilen tipteki cüzdan hareketlerini döndürür.
+
+        (user_id, islem_tipi, tarih) indeksi üzerinde aralık taraması yapılır;
+        hareketi doğuran üye (kaynak_user_id) aynı sorguda join edilir.
+
+        Returns:
+            [{"tarih", "miktar", "aciklama", "uye_no", "ad_soyad"}, ...] (eskiden yeniye)
+        """
+        ay_baslangic = datetime(yil, ay, 1, tzinfo=ZoneInfo("Europe/Istanbul"))
+        if ay == 12:
+            ay_bitis = ay_baslangic.replace(year=yil + 1, month=1)
+        else:
+            ay_bitis = ay_baslangic.replace(month=ay + 1)
+
+        satirlar = db.query(
+            models.CuzdanHareket, models.Kullanici.uye_no, models.Kullanici.tam_ad
+        ).outerjoin(
+            models.Kullanici, models.Kullanici.id == models.CuzdanHareket.kaynak_user_id
+        ).filter(
+            models.CuzdanHareket.user_id == user_id,
+            models.CuzdanHareket.islem_tipi == islem_tipi,
+            models.CuzdanHareket.tarih >= ay_baslangic,
+            models.CuzdanHareket.tarih < ay_bitis
+        ).order_by(models.CuzdanHareket.tarih, models.CuzdanHareket.id).all()
+
+        return [
+            {
+                "tarih": hareket.tarih,
+                "miktar": hareket.miktar or Decimal("0"),
+                "aciklama": hareket.aciklama,
+                "uye_no": uye_no,
+                "ad_soyad": tam_ad
+            }
+            for hareket, uye_no, tam_ad in satirlar
+        ]
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """
+        aylik_kazanclar tablosunu cuzdan_hareketleri'nden sıfırdan hesaplar.
+        Tek seferlik backfill / onarım işlemidir.
+
+        Returns:
+            Oluşturulan özet satırı sayısı
+        """
+        try:
+            db.execute(text("DELETE FROM aylik_kazanclar"))
+            sonuc = db.execute(text("""
+                INSERT INTO aylik_kazanclar (user_id, yil, ay, islem_tipi, toplam, adet)
+                SELECT
+                    user_id,
+                    EXTRACT(YEAR FROM tarih AT TIME ZONE 'Europe/Istanbul')::integer,
+                    EXTRACT(MONTH FROM tarih AT TIME ZONE 'Europe/Istanbul')::integer,
+                    islem_tipi,
+                    COALESCE(SUM(miktar), 0),
+                    COUNT(*)
+                FROM cuzdan_hareketleri
+                WHERE user_id IS NOT NULL AND islem_tipi IS NOT NULL AND tarih IS NOT NULL
+                GROUP BY 1, 2, 3, 4
+            """))
+            db.commit()
+
+            logger.info(f"Aylık kazanç özetleri yeniden oluşturuldu. Satır: {sonuc.rowcount}")
+            return sonuc.rowcount
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Aylık kazanç özetleri oluşturulurken hata: {e}")
+            raise
@@ -2,13 +2,16 @@
 Economy Service - MLM puan dağıtım işlemlerini yönetir.
 """
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import text
 from fastapi import HTTPException
 import logging
 from typing import Optional
 
-from app import models
-from app.services.commission_service import CommissionService
+from app import models, crud
+from app.services.commission_service import CommissionService, KomisyonDefteri
 from app.services.rank_service import RankService
+from app.services.binary_service import BinaryTreeService
 from app.crud import create_wallet_transaction
 
 logger = logging.getLogger(__name__)
@@ -17,62 +20,104 @@ logger = logging.getLogger(__name__)
 class EconomyService:
     """MLM ekonomisi tetikleme ve puan dağıtım servisi"""
     
+    # Sonsuz döngü / aşırı derin ağaç koruması (eski while limitinin karşılığı)
+    MAX_UPLINE_SEVIYE = 500
+
     @staticmethod
     def run_payout_workflow(db: Session, baslangic_id: int, satis_pv: int, satis_cv: float) -> None:
         """
-        Bir satıştan gelen PV puanını, ağaç yapısında yukarı doğru 7 seviyeye kadar dağıtır.
+        Bir satıştan gelen PV puanını, ağaç yapısında yukarı doğru tüm upline'a dağıtır.
         Bu işlem artık tamamen atomiktir. Ya herkes puanını alır ya da bir hata durumunda
         hiç kimse almaz ve tüm değişiklikler geri alınır.
+
+        Seviye başına sorgu yerine sabit sayıda sorgu kullanır:
+        1. Upline ata-torun indeksinden tek sorguda çekilir ve id sırasıyla kilitlenir
+        2. sol/sag ve toplam PV artışları tek toplu UPDATE ile uygulanır
+        3. Rütbe ve eşleşme kontrolleri bellekteki satırlar üzerinde yapılır
+        4. Komisyonlar KomisyonDefteri'nde toplanır; tek INSERT + tek UPDATE + tek commit
         """
         try:
-            current_id = baslangic_id
-            limit = 500  # Sonsuz döngü koruması
-
-            while current_id and limit > 0:
-                limit -= 1
-
-                mevcut_uye = db.query(models.Kullanici).filter(models.Kullanici.id == current_id).first()
-                if not mevcut_uye or not mevcut_uye.parent_id:
-                    break  # Zincir bitti
-
-                ust_uye_id = mevcut_uye.parent_id
-                kol_pozisyonu = mevcut_uye.kol
-
-                # Üst üyeyi satır seviyesinde kilitleyerek getir (Race Condition Önlemi)
-                try:
-                    # PostgreSQL gibi bunu destekleyen DB'ler için ideal
-                    ust_uye = db.query(models.Kullanici).filter(
-                        models.Kullanici.id == ust_uye_id
-                    ).with_for_update().first()
-                except Exception:
-                    # SQLite gibi desteklemeyen platformlar için fallback
-                    ust_uye = db.query(models.Kullanici).filter(
-                        models.Kullanici.id == ust_uye_id
-                    ).first()
-
-                if not ust_uye:
-                    break
-
-                # Puanları bellekte güncelle (henüz commit yok)
+            # 1. Upline'ı tek sorguda getir ve id sırasıyla kilitle (Deadlock / Race Condition Önlemi)
+            upline_sorgu = db.query(
+                models.Kullanici,
+                models.KullaniciAgacYolu.kol,
+                models.KullaniciAgacYolu.derinlik
+            ).join(
+                models.KullaniciAgacYolu,
+                models.KullaniciAgacYolu.ata_id == models.Kullanici.id
+            ).filter(
+                models.KullaniciAgacYolu.alt_id == baslangic_id,
+                models.KullaniciAgacYolu.derinlik <= EconomyService.MAX_UPLINE_SEVIYE
+            ).order_by(models.Kullanici.id)
+
+            # Kilit hatası (lock timeout, deadlock) transaction'ı bozar; kilitsiz devam
+            # edilmez, hata dıştaki rollback'e bırakılır
+            upline = upline_sorgu.with_for_update(of=models.Kullanici).all()
+
+            if not upline:
+                db.commit()
+                return
+
+            # 2. Tüm PV artışlarını tek UPDATE ile uygula (ata_id, kol) bazında
+            db.execute(text("""
+                UPDATE kullanicilar k
+                SET sol_pv = COALESCE(k.sol_pv, 0) + CASE WHEN y.kol = 'SOL' THEN :pv ELSE 0 END,
+                    toplam_sol_pv = COALESCE(k.toplam_sol_pv, 0) + CASE WHEN y.kol = 'SOL' THEN :pv ELSE 0 END,
+                    sag_pv = COALESCE(k.sag_pv, 0) + CASE WHEN y.kol = 'SAG' THEN :pv ELSE 0 END,
+                    toplam_sag_pv = COALESCE(k.toplam_sag_pv, 0) + CASE WHEN y.kol = 'SAG' THEN :pv ELSE 0 END
+                FROM kullanici_agac_yollari y
+                WHERE y.alt_id = :baslangic_id
+                  AND y.ata_id = k.id
+                  AND y.derinlik <= :max_seviye
+            """), {
+                "pv": satis_pv,
+                "baslangic_id": baslangic_id,
+                "max_seviye": EconomyService.MAX_UPLINE_SEVIYE
+            })
+
+            # Bellekteki satırları DB ile aynı hale getir (tekrar flush edilmeden)
+            for ust_uye, kol_pozisyonu, _ in upline:
                 if kol_pozisyonu == 'SOL':
-                    ust_uye.sol_pv = (ust_uye.sol_pv or 0) + satis_pv
-                    ust_uye.toplam_sol_pv = (ust_uye.toplam_sol_pv or 0) + satis_pv
+                    set_committed_value(ust_uye, "sol_pv", (ust_uye.sol_pv or 0) + satis_pv)
+                    set_committed_value(ust_uye, "toplam_sol_pv", (ust_uye.toplam_sol_pv or 0) + satis_pv)
                 else:  # SAĞ
-                    ust_uye.sag_pv = (ust_uye.sag_pv or 0) + satis_pv
-                    ust_uye.toplam_sag_pv = (ust_uye.toplam_sag_pv or 0) + satis_pv
+                    set_committed_value(ust_uye, "sag_pv", (ust_uye.sag_pv or 0) + satis_pv)
+                    set_committed_value(ust_uye, "toplam_sag_pv", (ust_uye.toplam_sag_pv or 0) + satis_pv)
 
-                # Rütbe kontrolünü yap
+            # 3. Rütbe ve eşleşme kontrolleri - eski akışla aynı sırada (alttan yukarı)
+            # Komisyonlar defterde birikir, ara commit yapılmaz
+            defter = KomisyonDefteri()
+            for ust_uye, _, _ in sorted(upline, key=lambda satir: satir[2]):
                 RankService.check_and_update(db, ust_uye)
 
-                # Eşleşme kontrolünü tetikle
-                CommissionService.check_matching(db, ust_uye.id)
+                if (ust_uye.sol_pv or 0) > 0 and (ust_uye.sag_pv or 0) > 0:
+                    CommissionService.apply_matching(db, ust_uye, defter)
 
-                # Bir sonraki seviyeye geç
-                current_id = ust_uye.id
+            # Commit sonrası satırlar expire olur; id'ler önceden alınır
+            upline_idleri = [ust_uye.id for ust_uye, _, _ in upline]
+            # Bakiyesi değişen kullanıcılar (defter flush'ta temizlenir)
+            kazananlar = list(defter.bakiye_farklari.keys())
 
-            # Döngü başarıyla bittiyse, tüm değişiklikleri tek seferde veritabanına işle
+            # 4. Bakiye farkları ve cüzdan hareketlerini toplu yaz
+            defter.flush(db)
+
+            # Tüm değişiklikleri tek seferde veritabanına işle
             db.commit()
-            logger.info(f"Puan dağıtımı başarıyla tamamlandı. Başlangıç ID: {baslangic_id}, PV: {satis_pv}")
+
+            # Commit edildi: Önbellek hatası işlemin sonucunu değiştirmemeli
+            try:
+                # PV'si değişen her upline üyesinin düğümü önbellekteki ağaçlarda bayatladı.
+                # Upline zaten birbirinin ataları olduğundan bu liste etkilenen ağaçları kapsar.
+                BinaryTreeService.invalidate_tree_cache_for(upline_idleri)
+                # Dashboard özetleri (PV, rütbe, bakiye) toplu yeniden yazılır (write-through)
+                crud.refresh_dashboard_summaries(db, upline_idleri + kazananlar)
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Puan dağıtımı sonrası önbellek güncellenemedi: {e}")
+            logger.info(
+                f"Puan dağıtımı başarıyla tamamlandı. Başlangıç ID: {baslangic_id}, "
+                f"PV: {satis_pv}, Upline: {len(upline)}"
+            )
 
         except Exception as e:
             # Herhangi bir hata oluşursa, bu transaction içindeki tüm değişiklikleri geri al
@@ -81,4 +126,4 @@ class EconomyService:
             raise HTTPException(
                 status_code=500,
                 detail=f"Puan dağıtımı sırasında kritik bir hata oluştu: {e}"
-            )
\ No newline at end of file
+            )
@@ -54,27 +54,15 @@ class OrderService:
                     detail="Sepetiniz boş! Sipariş oluşturamazsınız."
                 )
 
-            # 2. Sipariş toplam değerlerini hesapla
+            # 2. Sipariş toplam değerleri (sepet satırlarıyla aynı sorguda hesaplandı)
             toplam_fiyat = sepet_detay["toplam_fiyat"]
-            toplam_pv = 0
-            toplam_cv = 0.0
-
-            # Her ürün için PV ve CV hesapla
-            for urun_detay in sepet_detay["urunler"]:
-                urun = urun_detay["urun"]
-                adet = urun_detay["adet"]
-
-                # PV ve CV değerlerini topla
-                urun_pv = (urun.pv or 0) * adet
-                urun_cv = (urun.cv or 0.0) * adet
-
-                toplam_pv += urun_pv
-                toplam_cv += float(urun_cv)
+            toplam_pv = sepet_detay["toplam_pv"]
+            toplam_cv = float(sepet_detay["toplam_cv"])
 
             # 3. Sipariş kaydı oluştur
             yeni_siparis = models.Siparis(
                 kullanici_id=kullanici_id,
-                toplam_fiyat=toplam_fiyat,
+                toplam_tutar=toplam_fiyat,
                 toplam_pv=toplam_pv,
                 toplam_cv=toplam_cv,
                 adres=adres,
@@ -94,9 +82,11 @@ class OrderService:
                 siparis_urun = models.SiparisUrun(
                     siparis_id=yeni_siparis.id,
                     urun_id=urun.id,
+                    urun_adi=urun.ad,
                     adet=adet,
                     birim_fiyat=fiyat,
-                    toplam_fiyat=fiyat * adet
+                    pv_degeri=urun.pv_degeri,
+                    cv_degeri=urun.cv_degeri
                 )
                 db.add(siparis_urun)
 
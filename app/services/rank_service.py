@@ -6,6 +6,7 @@ import logging
 from typing import Optional
 
 from app import models
+from app.services.binary_service import BinaryTreeService
 from app.utils import RUTBE_GEREKSINIMLERI
 
 logger = logging.getLogger(__name__)
@@ -101,21 +102,6 @@ class RankService:
         """
         Kullanıcı sadece seçtiği kolun (SOL veya SAĞ) en dış hattına kayıt yapabilir.
         İç kollara (inner leg) kayıt yapılmasına izin vermez.
-        Recursive yapıdan While döngüsüne dönüştürülerek Stack Overflow riski sıfırlandı.
+        Dış hat BinaryTreeService.find_empty_spot ile tek recursive sorguda bulunur.
         """
-        current_parent_id = parent_id
-
-        while True:
-            # Mevcut parent'ın altında, seçilen kolda (SOL veya SAĞ) biri var mı?
-            mevcut_uye = db.query(models.Kullanici).filter(
-                models.Kullanici.parent_id == current_parent_id,
-                models.Kullanici.kol == tercih_kol
-            ).first()
-
-            if not mevcut_uye:
-                # Eğer o kol boşsa, burası kayıt için doğru yerdir.
-                return current_parent_id
-
-            # EĞER DOLUYSA:
-            # Bir alt basamağa geç ve döngüye devam et
-            current_parent_id = mevcut_uye.id
\ No newline at end of file
+        return BinaryTreeService.find_empty_spot(db, parent_id, tercih_kol)
@@ -9,14 +9,14 @@ Bu servis, yeni üye kaydı sürecinin tüm iş mantığını içerir:
 - Hoş geldin bonusu
 """
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
 import logging
-from decimal import Decimal
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from app import models, schemas, crud
-from app.services.commission_service import CommissionService
+from app import models, schemas, crud, settings_cache
+from app.services.commission_service import CommissionService, KomisyonDefteri
 
 logger = logging.getLogger(__name__)
 
@@ -28,19 +28,28 @@ class RegistrationService:
     DEFAULT_REFERRAL_BONUS = 50.0  # Referans bonusu (CV)
     DEFAULT_WELCOME_BONUS = 0.0    # Hoş geldin bonusu (CV)
 
+    # Unique indeks adında geçen alan -> kullanıcıya gösterilecek hata
+    BENZERSIZLIK_HATALARI = {
+        "email": "Bu email adresi zaten kullanılıyor!",
+        "telefon": "Bu telefon numarası zaten kullanılıyor!",
+        "tc_no": "Bu TC Kimlik No zaten kayıtlı!",
+        "uye_no": "Bu üye numarası zaten kullanılıyor!"
+    }
+
     @staticmethod
     def register_user(db: Session, kullanici_verisi: schemas.KullaniciKayit) -> models.Kullanici:
         """
         Yeni kullanıcı kaydı oluşturur.
 
-        Bu işlem atomic'tir ve şu adımları içerir:
-        1. Validasyonlar (email, telefon, TC no benzersizliği)
-        2. Sponsor doğrulama
-        3. Üye numarası oluşturma
-        4. Kullanıcı kaydı
-        5. Referans bonusu ödeme
-        6. Hoş geldin bonusu (varsa)
-        7. Cüzdan hareketleri
+        Tüm adımlar tek transaction ve tek commit ile yapılır:
+        1. Validasyonlar + sponsor doğrulama (tek sorgu)
+        2. Üye numarası oluşturma (sorgusuz, bkz. crud.generate_unique_member_number)
+        3. Kullanıcı kaydı (unique indeks çakışmaları kullanıcı dostu
+           hatalara çevrilir)
+        4. Referans bonusu + hoş geldin bonusu (komisyon defteri ile toplu yazım)
+
+        Ön kontrol sadece hızlı ve anlaşılır hata içindir; eşzamanlı kayıtlarda
+        asıl güvence veritabanındaki unique indekslerdir.
 
         Args:
             db: Database session
@@ -53,93 +62,84 @@ class RegistrationService:
             HTTPException: Validasyon hatası veya kayıt başarısız ise
         """
         try:
-            # 1. VALIDASYONLAR
+            # 1. VALIDASYONLAR + SPONSOR DOĞRULAMA
+            cakismalar = crud.get_registration_conflicts(
+                db,
+                kullanici_verisi.email,
+                kullanici_verisi.telefon,
+                kullanici_verisi.tc_no,
+                kullanici_verisi.referans_id
+            )
 
-            # Email benzersizliği
-            if crud.get_user_by_email(db, kullanici_verisi.email):
-                raise HTTPException(
-                    status_code=400,
-                    detail="Bu email adresi zaten kullanılıyor!"
-                )
+            if cakismalar.email_var:
+                raise HTTPException(status_code=400, detail=RegistrationService.BENZERSIZLIK_HATALARI["email"])
 
-            # Telefon benzersizliği
-            if kullanici_verisi.telefon and crud.get_user_by_phone(db, kullanici_verisi.telefon):
-                raise HTTPException(
-                    status_code=400,
-                    detail="Bu telefon numarası zaten kullanılıyor!"
-                )
+            if cakismalar.telefon_var:
+                raise HTTPException(status_code=400, detail=RegistrationService.BENZERSIZLIK_HATALARI["telefon"])
 
-            # TC No benzersizliği (varsa)
-            if kullanici_verisi.tc_no and crud.get_user_by_tc_no(db, kullanici_verisi.tc_no):
-                raise HTTPException(
-                    status_code=400,
-                    detail="Bu TC Kimlik No zaten kayıtlı!"
-                )
+            if cakismalar.tc_var:
+                raise HTTPException(status_code=400, detail=RegistrationService.BENZERSIZLIK_HATALARI["tc_no"])
 
-            # 2. SPONSOR DOĞRULAMA
-            sponsor = crud.get_user(db, kullanici_verisi.referans_id)
-            if not sponsor:
+            if not cakismalar.sponsor_var:
                 raise HTTPException(
                     status_code=404,
                     detail="Sponsor kullanıcı bulunamadı!"
                 )
 
-            # 3. ÜYE NUMARASI OLUŞTUR
-            # Eğer kullanıcı verisi içinde üye no yoksa oluştur
-            if not kullanici_verisi.uye_no:
-                kullanici_verisi.uye_no = crud.generate_unique_member_number(db)
+            sponsor_id = kullanici_verisi.referans_id
 
-            # 4. KULLANICI KAYDI OLUŞTUR
-            yeni_uye = crud.create_user(db, kullanici_verisi)
+            # 2-3. ÜYE NUMARASI + KULLANICI KAYDI
+            yeni_uye = RegistrationService._create_user_row(db, kullanici_verisi)
 
-            # 5. REFERANS BONUSU ÖDE
-            # Ayarlardan referans bonusu miktarını al
-            referans_bonusu = RegistrationService._get_setting(
+            # 4. BONUSLAR (ayarlar süreç içi önbellekten)
+            defter = KomisyonDefteri()
+
+            referans_bonusu = settings_cache.get_ayar_or_create(
                 db, "referans_bonusu", RegistrationService.DEFAULT_REFERRAL_BONUS
             )
-
             if referans_bonusu > 0:
                 CommissionService.pay_referral_bonus(
                     db,
-                    sponsor.id,
+                    sponsor_id,
                     referans_bonusu,
-                    yeni_uye.tam_ad
+                    yeni_uye.tam_ad,
+                    defter,
+                    yeni_uye_id=yeni_uye.id
                 )
 
-            # 6. HOŞ GELDİN BONUSU (Yeni üyeye)
-            hosgeldin_bonusu = RegistrationService._get_setting(
+            hosgeldin_bonusu = settings_cache.get_ayar_or_create(
                 db, "hosgeldin_bonusu", RegistrationService.DEFAULT_WELCOME_BONUS
             )
-
             if hosgeldin_bonusu > 0:
-                yeni_uye.toplam_cv = (yeni_uye.toplam_cv or Decimal("0")) + Decimal(str(hosgeldin_bonusu))
-                db.commit()
+                defter.ekle(yeni_uye.id, hosgeldin_bonusu, "HOŞGELDİN", "Hoş geldin bonusu")
 
-                # Cüzdan hareketi logla
-                crud.create_wallet_transaction(
-                    db,
-                    models.CuzdanHareket(
-                        user_id=yeni_uye.id,
-                        miktar=hosgeldin_bonusu,
-                        islem_tipi="HOŞGELDİN",
-                        aciklama="Hoş geldin bonusu"
-                    )
-                )
+            # Cüzdan hareketleri, aylık özet ve bakiyeler toplu yazılır
+            defter.flush(db)
+            db.commit()
 
             db.refresh(yeni_uye)
 
+            # Sponsorun referans/bekleyen sayısı ve bakiyesi değişti (write-through).
+            # Kayıt commit edildi: Önbellek hatası kaydı başarısız göstermemeli
+            try:
+                crud.refresh_dashboard_summaries(db, [sponsor_id])
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Kayıt sonrası dashboard önbelleği güncellenemedi. Sponsor ID: {sponsor_id}: {e}")
+
             logger.info(
                 f"Yeni kullanıcı kaydedildi. "
                 f"ID: {yeni_uye.id}, "
                 f"Üye No: {yeni_uye.uye_no}, "
                 f"Email: {yeni_uye.email}, "
-                f"Sponsor ID: {sponsor.id}"
+                f"Sponsor ID: {sponsor_id}"
             )
 
             return yeni_uye
 
         except HTTPException:
             # HTTPException'ları olduğu gibi fırlat
+            db.rollback()
             raise
 
         except Exception as e:
@@ -150,6 +150,38 @@ class RegistrationService:
                 detail=f"Kayıt işlemi başarısız: {str(e)}"
             )
 
+    @staticmethod
+    def _create_user_row(db: Session, kullanici_verisi: schemas.KullaniciKayit) -> models.Kullanici:
+        """
+        Kullanıcı satırını ekler (commit etmez).
+
+        Otomatik üye numarası eski numaralardan ayrık bir uzaydan geldiği için
+        çakışmaz; eşzamanlı kayıtlarda oluşan unique indeks ihlalleri kullanıcı
+        dostu HTTPException'a çevrilir.
+        """
+        if not kullanici_verisi.uye_no:
+            kullanici_verisi.uye_no = crud.generate_unique_member_number(db)
+
+        try:
+            return crud.create_user(db, kullanici_verisi, commit=False)
+
+        except IntegrityError as e:
+            alan = RegistrationService._cakisan_alan(e)
+            if alan is None:
+                raise
+            raise HTTPException(status_code=400, detail=RegistrationService.BENZERSIZLIK_HATALARI[alan])
+
+    @staticmethod
+    def _cakisan_alan(hata: IntegrityError):
+        """IntegrityError'ın hangi benzersiz alandan kaynaklandığını bulur (yoksa None)."""
+        diag = getattr(hata.orig, "diag", None)
+        kaynak = (getattr(diag, "constraint_name", None) or str(hata.orig)).lower()
+
+        for alan in RegistrationService.BENZERSIZLIK_HATALARI:
+            if alan in kaynak:
+                return alan
+        return None
+
     @staticmethod
     def validate_sponsor(db: Session, sponsor_identifier: str) -> models.Kullanici:
         """
@@ -227,22 +259,3 @@ class RegistrationService:
 
         existing = crud.get_user_by_tc_no(db, tc_no)
         return existing is None
-
-    @staticmethod
-    def _get_setting(db: Session, anahtar: str, varsayilan: float) -> float:
-        """
-        Ayarları getirir, yoksa oluşturur.
-
-        Args:
-            db: Database session
-            anahtar: Ayar anahtarı
-            varsayilan: Varsayılan değer
-
-        Returns:
-            Ayar değeri
-        """
-        db_ayar = crud.get_setting(db, anahtar)
-        if not db_ayar:
-            crud.create_or_update_setting(db, anahtar, varsayilan)
-            return varsayilan
-        return db_ayar.deger
@@ -0,0 +1,153 @@
+"""
+Ayar Önbelleği - Ayarlar, SiteAyarlari ve nesil oranları için süreç içi önbellek.
+
+Sıcak yollar (komisyon hesaplama, kayıt, auth middleware) ayarları her çağrıda
+veritabanından okumak yerine bu modüldeki yerel TTL sözlüğünden okur.
+
+Geçersiz kılma (invalidation):
+- Admin ayar POST handler'ları kayıttan sonra invalidate() çağırır
+- invalidate() yerel önbelleği temizler ve Redis pub/sub kanalına mesaj yayınlar
+- Her worker'daki arka plan aboneliği mesajı alıp kendi önbelleğini temizler
+- Redis yoksa değerler en geç AYAR_CACHE_TTL saniyede yenilenir; abonelik
+  Redis geri geldiğinde kendiliğinden yeniden kurulur
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import models, redis_client
+
+logger = logging.getLogger(__name__)
+
+AYAR_CACHE_TTL = 60  # saniye - Redis erişilemezse güvenlik ağı
+INVALIDATION_KANALI = "ayarlar:invalidate"
+TUMU = "*"
+
+# Önbellek anahtarları
+AYARLAR = "ayarlar"
+SITE_AYARLARI = "site_ayarlari"
+NESIL_ORANLARI = "nesil_oranlari"
+
+_cache: Dict[str, Tuple[float, Any]] = {}
+_abonelik_kilidi = threading.Lock()
+_abonelik_basladi = False
+
+
+def get_or_load(anahtar: str, loader: Callable[[], Any]) -> Any:
+    """Önbellekteki değeri döndürür; yoksa veya süresi dolduysa loader ile yükler."""
+    _abonelik_baslat()
+
+    kayit = _cache.get(anahtar)
+    if kayit is not None and time.monotonic() - kayit[0] < AYAR_CACHE_TTL:
+        return kayit[1]
+
+    deger = loader()
+    _cache[anahtar] = (time.monotonic(), deger)
+    return deger
+
+
+def invalidate(anahtar: str = TUMU, yayinla: bool = True) -> None:
+    """
+    Önbellek anahtarını (varsayılan: tümü) temizler.
+    yayinla=True ise diğer worker'lara da pub/sub ile bildirir.
+    """
+    _yerel_temizle(anahtar)
+    if yayinla:
+        redis_client.publish_message(INVALIDATION_KANALI, anahtar)
+
+
+def get_ayar(db: Session, anahtar: str) -> Optional[Any]:
+    """Ayarlar tablosundaki değeri döndürür; kayıt yoksa None."""
+    def _yukle():
+        return {ayar.anahtar: ayar.deger for ayar in db.query(models.Ayarlar.anahtar, models.Ayarlar.deger).all()}
+
+    return get_or_load(AYARLAR, _yukle).get(anahtar)
+
+
+def get_ayar_or_create(db: Session, anahtar: str, varsayilan: Any) -> Any:
+    """
+    Ayarlar tablosundaki değeri döndürür; kayıt yoksa varsayılanı ekleyip döndürür.
+
+    Ekleme INSERT ... ON CONFLICT DO NOTHING ile yapılır: Önbelleğinde anahtar
+    henüz olmayan diğer worker'lar aynı varsayılanı tekrar eklemeye çalışsa da
+    unique ihlali olmaz (çağıranın transaction'ı düşmez). Commit etmez.
+    """
+    deger = get_ayar(db, anahtar)
+    if deger is not None:
+        return deger
+
+    db.execute(text("""
+        INSERT INTO ayarlar (anahtar, deger) VALUES (:anahtar, :deger)
+        ON CONFLICT (anahtar) DO NOTHING
+    """), {"anahtar": anahtar, "deger": varsayilan})
+    # Sonraki okumada (commit sonrası) tablodan yeniden yüklensin
+    _yerel_temizle(AYARLAR)
+    return varsayilan
+
+
+def get_site_ayarlari(db: Session) -> Optional[models.SiteAyarlari]:
+    """
+    SiteAyarlari kaydını döndürür. Nesne session'dan ayrılmış (detached) olarak
+    önbelleğe alınır; sadece okuma amaçlıdır.
+    """
+    def _yukle():
+        ayarlar = db.query(models.SiteAyarlari).first()
+        if ayarlar is not None:
+            db.expunge(ayarlar)
+        return ayarlar
+
+    return get_or_load(SITE_AYARLARI, _yukle)
+
+
+def _yerel_temizle(anahtar: str) -> None:
+    if anahtar == TUMU:
+        _cache.clear()
+    else:
+        _cache.pop(anahtar, None)
+
+
+def _abonelik_baslat() -> None:
+    """Invalidation kanalını dinleyen arka plan thread'ini (worker başına bir kez) başlatır."""
+    global _abonelik_basladi
+
+    if _abonelik_basladi:
+        return
+
+    with _abonelik_kilidi:
+        if _abonelik_basladi:
+            return
+        thread = threading.Thread(target=_abonelik_dongusu, name="ayar-cache-abonelik", daemon=True)
+        thread.start()
+        _abonelik_basladi = True
+
+
+def _abonelik_dongusu() -> None:
+    while True:
+        pubsub = redis_client.get_pubsub()
+        if pubsub is None:
+            # Redis erişilemiyor (devre açık) - TTL güvenlik ağı devrede; sonra tekrar dene
+            time.sleep(redis_client.REDIS_YENIDEN_DENEME_ARALIGI)
+            continue
+
+        try:
+            pubsub.subscribe(INVALIDATION_KANALI)
+            # Bağlantı koptuğu sürede kaçan mesajlar olabilir
+            _yerel_temizle(TUMU)
+            for mesaj in pubsub.listen():
+                if mesaj.get("type") == "message":
+                    veri = mesaj.get("data")
+                    if isinstance(veri, bytes):
+                        veri = veri.decode("utf-8")
+                    _yerel_temizle(veri or TUMU)
+        except Exception as e:
+            logger.warning(f"Ayar önbelleği aboneliği koptu, yeniden bağlanılıyor: {e}")
+            time.sleep(1)
+        finally:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Binary ağaç ata-torun indeksini (kullanici_agac_yollari) oluşturur
+Mevcut kullanicilar.parent_id verisinden tek seferlik backfill yapar
+"""
+from app.database import SessionLocal, engine
+from app.models import Base
+from app.services.binary_service import BinaryTreeService
+from sqlalchemy import inspect
+
+def migrate():
+    print("🔧 Ata-torun indeksi tablosu oluşturuluyor...")
+
+    # Tabloyu oluştur
+    Base.metadata.create_all(bind=engine)
+
+    # Tablo var mı kontrol et
+    inspector = inspect(engine)
+    if 'kullanici_agac_yollari' not in inspector.get_table_names():
+        print("❌ Tablo oluşturulamadı!")
+        return
+
+    print("✅ Tablo başarıyla oluşturuldu")
+
+    db = SessionLocal()
+    try:
+        print("📝 Mevcut ağaç yapısından indeks dolduruluyor...")
+        satir_sayisi = BinaryTreeService.rebuild_ancestry_index(db)
+        print(f"✅ İndeks hazır! 📊 Toplam ata-torun satırı: {satir_sayisi}")
+
+    except Exception as e:
+        print(f"❌ Hata: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Aylık kazanç özet tablosunu (aylik_kazanclar) oluşturur ve mevcut cüzdan
+hareketlerinden doldurur
+Yeniden çalıştırıldığında özetleri sıfırdan hesaplar (rebuild)
+"""
+from app.database import SessionLocal, engine
+from app import models
+from app.services.earnings_service import EarningsService
+
+def migrate():
+    print("🔧 aylik_kazanclar tablosu oluşturuluyor...")
+    models.Base.metadata.create_all(bind=engine, tables=[models.AylikKazanc.__table__])
+    print("✅ Tablo hazır")
+
+    db = SessionLocal()
+    try:
+        print("📝 Özetler cüzdan hareketlerinden hesaplanıyor...")
+        satir = EarningsService.rebuild(db)
+        print(f"✅ {satir} aylık özet satırı oluşturuldu!")
+
+    except Exception as e:
+        print(f"❌ Hata: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
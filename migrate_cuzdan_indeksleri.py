@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+cuzdan_hareketleri tablosuna ekstre ve bonus sayfaları için composite indeksleri ekler
+- ix_cuzdan_user_tarih_id: (user_id, tarih, id) - keyset ekstre (geriye taranır)
+- ix_cuzdan_user_tip_tarih: (user_id, islem_tipi, tarih) - bonus sayfaları
+Eski tekil user_id indeksi composite indekslerin ilk kolonu ile karşılandığı için kaldırılır.
+
+CONCURRENTLY ile çalışır (tabloyu yazmaya kilitlemez); tekrar çalıştırılabilir.
+ix_cuzdan_user_tarih_id'nin eski karışık yönlü (tarih DESC, id) sürümü varsa
+kaldırılıp yeniden oluşturulur.
+"""
+from app.database import engine
+from sqlalchemy import text
+
+INDEKSLER = [
+    ("ix_cuzdan_user_tarih_id", "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_cuzdan_user_tarih_id "
+                                "ON cuzdan_hareketleri (user_id, tarih, id)"),
+    ("ix_cuzdan_user_tip_tarih", "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_cuzdan_user_tip_tarih "
+                                 "ON cuzdan_hareketleri (user_id, islem_tipi, tarih)"),
+    ("ix_cuzdan_hareketleri_user_id (kaldır)", "DROP INDEX CONCURRENTLY IF EXISTS ix_cuzdan_hareketleri_user_id"),
+]
+
+def migrate():
+    print("🔧 Cüzdan hareketleri indeksleri oluşturuluyor...")
+
+    # CONCURRENTLY transaction içinde çalışamaz; büyük tabloda statement_timeout'a takılmasın
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SET statement_timeout = 0"))
+
+        # Eski sürüm (user_id, tarih DESC, id): ORDER BY tarih DESC, id DESC ile
+        # yönler uyuşmadığından imleç sınırı indeksten karşılanamıyordu
+        eski_tanim = conn.execute(text(
+            "SELECT indexdef FROM pg_indexes WHERE indexname = 'ix_cuzdan_user_tarih_id'"
+        )).scalar()
+        if eski_tanim and "DESC" in eski_tanim:
+            conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_cuzdan_user_tarih_id"))
+            print("♻️  ix_cuzdan_user_tarih_id eski tanımı kaldırıldı, yeniden oluşturulacak")
+
+        for ad, sql in INDEKSLER:
+            try:
+                conn.execute(text(sql))
+                print(f"✅ {ad}")
+            except Exception as e:
+                print(f"❌ Hata: {e}")
+
+    print("✅ İndeksler hazır")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+cuzdan_hareketleri tablosuna kaynak_user_id kolonunu ekler (hareketi doğuran üye)
+Eski referans bonusu hareketleri, sponsorun aynı adlı referans üyelerinden kayıt
+tarihi harekete en yakın olanla eşleştirilerek doldurulur (tek seferlik backfill).
+Tekrar çalıştırılabilir; sadece boş kaynak_user_id'ler doldurulur.
+"""
+from app.database import engine
+from sqlalchemy import text
+
+def migrate():
+    print("🔧 cuzdan_hareketleri.kaynak_user_id kolonu ekleniyor...")
+
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        conn.execute(text("ALTER TABLE cuzdan_hareketleri ADD COLUMN IF NOT EXISTS kaynak_user_id INTEGER"))
+        print("✅ Kolon hazır")
+
+        print("📝 Eski referans bonusu hareketleri eşleştiriliyor...")
+        sonuc = conn.execute(text("""
+            UPDATE cuzdan_hareketleri h
+            SET kaynak_user_id = e.kaynak_id
+            FROM (
+                SELECT DISTINCT ON (h2.id) h2.id AS hareket_id, k.id AS kaynak_id
+                FROM cuzdan_hareketleri h2
+                JOIN kullanicilar k
+                  ON k.referans_id = h2.user_id
+                 AND h2.aciklama = 'Yeni kayıt: ' || k.tam_ad
+                WHERE h2.islem_tipi = 'REFERANS' AND h2.kaynak_user_id IS NULL
+                ORDER BY h2.id, abs(extract(epoch FROM h2.tarih - k.kayit_tarihi))
+            ) e
+            WHERE h.id = e.hareket_id
+        """))
+        print(f"✅ {sonuc.rowcount} hareket eşleştirildi")
+
+if __name__ == "__main__":
+    migrate()
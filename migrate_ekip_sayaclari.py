@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Kullanıcı tablosuna sol/sağ ekip sayaçlarını ekler ve mevcut ağaçtan doldurur
+Önkoşul: migrate_agac_yollari.py (ata-torun indeksi) çalıştırılmış olmalı
+Yeniden çalıştırıldığında sayaçları sıfırdan hesaplar (rebuild)
+"""
+from app.database import SessionLocal, engine
+from app.services.binary_service import BinaryTreeService
+from sqlalchemy import text
+
+def migrate():
+    print("🔧 Ekip sayacı kolonları ekleniyor...")
+
+    # create_all mevcut tabloya kolon eklemez, ALTER TABLE gerekir
+    with engine.begin() as conn:
+        conn.execute(text(
+            "ALTER TABLE kullanicilar ADD COLUMN IF NOT EXISTS sol_ekip_sayisi INTEGER NOT NULL DEFAULT 0"
+        ))
+        conn.execute(text(
+            "ALTER TABLE kullanicilar ADD COLUMN IF NOT EXISTS sag_ekip_sayisi INTEGER NOT NULL DEFAULT 0"
+        ))
+
+    print("✅ Kolonlar hazır")
+
+    db = SessionLocal()
+    try:
+        print("📝 Sayaçlar ata-torun indeksinden hesaplanıyor...")
+        BinaryTreeService.rebuild_leg_counters(db)
+        print("✅ Ekip sayaçları başarıyla güncellendi!")
+
+    except Exception as e:
+        print(f"❌ Hata: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
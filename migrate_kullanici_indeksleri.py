@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+kullanicilar tablosuna ağaç / sponsor / kayıt sorguları için indeksleri ekler
+- ux_kullanicilar_parent_kol: UNIQUE (parent_id, kol) - her kolda tek çocuk
+- ix_kullanicilar_referans_parent: (referans_id, parent_id) - sponsor ve bekleyen üye sorguları
+- ux_kullanicilar_telefon: UNIQUE (telefon) WHERE telefon <> ''
+- ux_kullanicilar_tc_no: UNIQUE (tc_no) WHERE tc_no <> ''
+
+CONCURRENTLY ile çalışır (tabloyu yazmaya kilitlemez); tekrar çalıştırılabilir.
+Unique indeksler mevcut veride tekrar eden değer varsa oluşturulamaz: önce
+tekrarlar listelenir, o indeks atlanır (veri düzeltildikten sonra tekrar çalıştırın).
+"""
+from app.database import engine
+from sqlalchemy import text
+
+# (ad, indeks sql, tekrar kontrol sql - unique değilse None)
+INDEKSLER = [
+    ("ux_kullanicilar_parent_kol",
+     "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_kullanicilar_parent_kol "
+     "ON kullanicilar (parent_id, kol)",
+     "SELECT parent_id::text || ' / ' || kol::text, COUNT(*) FROM kullanicilar "
+     "WHERE parent_id IS NOT NULL AND kol IS NOT NULL GROUP BY parent_id, kol HAVING COUNT(*) > 1"),
+    ("ix_kullanicilar_referans_parent",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_kullanicilar_referans_parent "
+     "ON kullanicilar (referans_id, parent_id)",
+     None),
+    ("ux_kullanicilar_telefon",
+     "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_kullanicilar_telefon "
+     "ON kullanicilar (telefon) WHERE telefon <> ''",
+     "SELECT telefon, COUNT(*) FROM kullanicilar WHERE telefon <> '' GROUP BY telefon HAVING COUNT(*) > 1"),
+    ("ux_kullanicilar_tc_no",
+     "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_kullanicilar_tc_no "
+     "ON kullanicilar (tc_no) WHERE tc_no <> ''",
+     "SELECT tc_no, COUNT(*) FROM kullanicilar WHERE tc_no <> '' GROUP BY tc_no HAVING COUNT(*) > 1"),
+]
+
+def migrate():
+    print("🔧 Kullanıcı indeksleri oluşturuluyor...")
+
+    # CONCURRENTLY transaction içinde çalışamaz; büyük tabloda statement_timeout'a takılmasın
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SET statement_timeout = 0"))
+        for ad, sql, tekrar_sql in INDEKSLER:
+            if tekrar_sql:
+                tekrarlar = conn.execute(text(tekrar_sql)).fetchall()
+                if tekrarlar:
+                    print(f"⚠️  {ad} atlandı, tekrar eden {len(tekrarlar)} değer var:")
+                    for deger, adet in tekrarlar[:20]:
+                        print(f"   - {deger} ({adet} kayıt)")
+                    continue
+            try:
+                conn.execute(text(sql))
+                print(f"✅ {ad}")
+            except Exception as e:
+                # Yarıda kalan CONCURRENTLY indeks INVALID olarak kalır; temizle
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {ad}"))
+                print(f"❌ Hata ({ad}): {e}")
+
+    print("✅ İndeksler hazır")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Üye numarası ayırıcısı için uye_no_seq sırasını oluşturur
+crud.generate_unique_member_number bu sıradan blok halinde numara ayırır
+Yeni numaralar 90 + 8 hanedir; eski rastgele numaralar (90 + 7 hane) ile
+uzunlukları farklı olduğundan çakışmazlar
+Tekrar çalıştırılabilir (mevcut sıranın değerine dokunmaz, sadece üst sınırını günceller)
+"""
+from app.database import engine
+from app import models
+from sqlalchemy import text
+
+def migrate():
+    print("🔧 uye_no_seq sırası oluşturuluyor...")
+    models.UYE_NO_SIRASI.create(bind=engine, checkfirst=True)
+
+    # 7 haneli uzay için oluşturulmuş eski sıranın üst sınırını genişlet
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER SEQUENCE uye_no_seq MAXVALUE {models.UYE_NO_SIRASI.maxvalue}"))
+    print("✅ Sıra hazır")
+
+    # Yeni uzayda (90 + 8 hane) elle girilmiş numara varsa uyar
+    with engine.connect() as conn:
+        yeni_uzayda = conn.execute(text(
+            "SELECT COUNT(*) FROM kullanicilar WHERE uye_no LIKE '90%' AND length(uye_no) = :uzunluk"
+        ), {"uzunluk": 2 + models.UYE_NO_HANE}).scalar()
+    if yeni_uzayda:
+        print(f"⚠️  Yeni numara uzayında {yeni_uzayda} mevcut üye numarası var; bunlar kontrol edilmeli")
+    else:
+        print("✅ Yeni numara uzayı boş (eski numaralarla çakışma yok)")
+
+if __name__ == "__main__":
+    migrate()